@@ -0,0 +1,168 @@
+'''
+    Batch Posterior Matching Scheme
+
+Runs many standard PMS transmissions in lockstep. The probability of every
+message is kept as a row of the arrays used by IntervalArray: sorted interval
+boundaries and the cumulative probability at each of them. Each channel use
+cuts a row at most once, rows with fewer boundaries are padded, so one
+channel use is a handful of array operations on the whole batch. Finished
+messages are retired from the arrays as they converge.
+
+Works on float64, like IntervalArray, with the same arithmetic as PMS on it:
+every message gives the same result as PMS(..., structure='array') with the
+same random stream.
+'''
+
+import numpy as np
+from progress import logger
+
+log = logger('batch')
+
+class BatchPMS():
+    def __init__(self, crossover_prob, err_prob, rng=None):
+        self.XoverP = crossover_prob # crossover probability
+        self.errP = err_prob # error probability
+        self.rng = np.random.default_rng(rng) # seeds messages without their own
+
+    # encode binary sequences ('0'/'1' strings or ints) to real numbers,
+    # like PMS.bin_to_real
+    def bin_to_real(self, seqs, lengths):
+        dec = [int(s, 2) if isinstance(s, str) else int(s) for s in seqs]
+        return np.array([float(2*d + 1) / 2**(int(l) + 1) for d, l in zip(dec, lengths)])
+
+    # decode real numbers to message orders like PMS.real_to_order:
+    # int(round(v * 2^l, 2)) is the floor unless the fraction rounds up
+    def real_to_order(self, nums, lengths):
+        scaled = nums * 2.0**lengths
+        order = np.floor(scaled)
+        frac = scaled - order
+        order = order.astype(np.int64) + (frac > 0.995)
+        for r in np.nonzero(np.abs(frac - 0.995) < 1e-9)[0]: # too close to tell
+            order[r] = int(round(float(scaled[r]), 2))
+        return np.minimum(order, 2**lengths - 1)
+
+    # message of an order, as the messages were given
+    def decoded(self, order, length, packed):
+        return int(order) if packed else format(order, '0{}b'.format(length))
+
+    # PMF of every row at the points x, one row of points per row, like
+    # IntervalArray.PMF_pair
+    @staticmethod
+    def PMF(breaks, cum, size, x):
+        rows = np.arange(len(x))[:, None]
+        i = np.clip((breaks[:, None, :] <= x[:, :, None]).sum(axis=2) - 1, 0, (size - 2)[:, None])
+        b0, b1 = breaks[rows, i], breaks[rows, i+1]
+        c0, c1 = cum[rows, i], cum[rows, i+1]
+        return c0 + (c1 - c0) * (x - b0) / (b1 - b0)
+
+    def transmit(self, seqs, max_channel_use=None, seeds=None, seq_len=None):
+        """ Transmit all messages, return (bin_seq, value, use) per message
+
+        Messages are '0'/'1' strings, or ints of seq_len bits which are then
+        decoded to ints. seeds gives the random stream of each message (Generator, SeedSequence
+        or seed), the same stream as PMS(..., rng=seed) would use. Every
+        result is the same as that of PMS(..., structure='array', rng=seed).
+        """
+        B = len(seqs)
+        results = [None] * B
+        if B == 0:
+            return results
+        max_default_use = 500
+        MCU = max_channel_use if max_channel_use is not None else max_default_use
+
+        # channel noise of every message, one row per message
+        if seeds is None:
+            seeds = self.rng.integers(2**63, size=B)
+        noise = np.stack([np.random.default_rng(s).random(MCU) for s in seeds])
+
+        # masses of the two sides of the peak, the same numbers as PMS
+        P, Q = self.XoverP, 1 - self.XoverP
+
+        # state of the active messages: a row keeps the boundaries of
+        # IntervalArray in its first size columns, the others are padding
+        # above 1 with probability 1
+        active = np.arange(B)
+        packed = seq_len is not None
+        lengths = np.full(B, seq_len) if packed else np.array([len(s) for s in seqs])
+        msg_point = self.bin_to_real(seqs, lengths)
+        breaks = np.tile([0, 0.5, 1], (B, 1))
+        cum = np.tile([0, 0.5, 1], (B, 1))
+        size = np.full(B, 3)
+        peak = np.full(B, 0.5)
+        # decoded order, its boundaries and their PMF, see PMS.check_ending
+        cell_order = np.full(B, -1)
+        cell_b = np.zeros((B, 2))
+        cell_p = np.zeros((B, 2))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in range(MCU):
+                rows = np.arange(len(active))
+                n = breaks.shape[1]
+                cols = np.arange(n)
+
+                # encoding and decoding messages
+                X = msg_point > peak
+                Y = X ^ (noise[active, k] < self.XoverP)
+
+                # update probability on both sides of the peak, and the PMF
+                # of the decoded interval with it, see IntervalArray.rescale
+                # and PMS.rescale
+                m0 = np.where(Y, P, Q)[:, None]
+                m1 = np.where(Y, Q, P)[:, None]
+                cut = (breaks < peak[:, None]).sum(axis=1)
+                M = cum[rows, cut][:, None]
+                low = np.where(M > 0, cum * (m0 / M), cum)
+                high = np.where(M < 1, m0 + (cum - M) * (m1 / (1 - M)), cum)
+                cum = np.where(cols < cut[:, None], low, np.where(cols < (size - 1)[:, None], high, cum))
+                cum[rows, size - 1] = 1
+                cell_p = np.where(cell_b < peak[:, None],
+                    np.where(M > 0, cell_p * (m0 / M), 0),
+                    np.where(M < 1, m0 + (cell_p - M) * (m1 / (1 - M)), m0))
+
+                # find the new middle points and insert those which are not
+                # boundaries yet
+                i = np.clip((cum <= 0.5).sum(axis=1) - 1, 0, size - 2)
+                b0, b1 = breaks[rows, i], breaks[rows, i+1]
+                c0, c1 = cum[rows, i], cum[rows, i+1]
+                found = c0 == 0.5
+                peak = np.where(found, b0, b0 + (b1 - b0) * (0.5 - c0) / (c1 - c0))
+                insert = ~found
+                if insert.any():
+                    breaks = np.hstack((breaks, np.full((len(rows), 1), 2.0)))
+                    cum = np.hstack((cum, np.ones((len(rows), 1))))
+                    src = np.arange(n + 1) - (insert[:, None] & (np.arange(n + 1) > (i + 1)[:, None]))
+                    breaks = np.take_along_axis(breaks, src, axis=1)
+                    cum = np.take_along_axis(cum, src, axis=1)
+                    r = rows[insert]
+                    breaks[r, i[r] + 1], cum[r, i[r] + 1] = peak[r], 0.5
+                    size = size + insert
+
+                # check ending conditions, the PMF of the decoded interval is
+                # only computed when it changes
+                order = self.real_to_order(peak, lengths)
+                changed = order != cell_order
+                if changed.any():
+                    r = rows[changed]
+                    cell_order[r] = order[r]
+                    cell_b[r] = np.stack((order[r], order[r] + 1), axis=1) / 2.0**lengths[r][:, None]
+                    cell_p[r] = self.PMF(breaks[r], cum[r], size[r], cell_b[r])
+                done = cell_p[:, 1] - cell_p[:, 0] > 1 - self.errP
+                for r in np.nonzero(done)[0]:
+                    results[active[r]] = (self.decoded(order[r], lengths[r], packed), float(peak[r]), k+1)
+
+                # retire finished messages
+                if done.any():
+                    keep = ~done
+                    active, lengths, msg_point = active[keep], lengths[keep], msg_point[keep]
+                    breaks, cum, size, peak = breaks[keep], cum[keep], size[keep], peak[keep]
+                    cell_order, cell_b, cell_p = cell_order[keep], cell_b[keep], cell_p[keep]
+                    m = size.max() if len(size) else 0
+                    breaks, cum = breaks[:, :m], cum[:, :m]
+                if len(active) == 0:
+                    return results
+
+        order = self.real_to_order(peak, lengths)
+        for r in range(len(active)):
+            results[active[r]] = (self.decoded(order[r], lengths[r], packed), float(peak[r]), MCU)
+        log.warning("%d messages have reached the maximum expected channel uses!", len(active))
+        return results
@@ -0,0 +1,247 @@
+'''
+Benchmarks of the posterior tree, the Hamming codec and the transmissions
+
+Every benchmark times single operations with perf_counter after a few
+warm-up calls, and reports operations per second and latency percentiles.
+The setup of an operation, e.g. finding the node to rotate, is not timed.
+Peak memory is the largest memory allocated by one operation, measured in a
+separate run under tracemalloc, which slows the code down. Transmissions are
+timed per message, their operations are channel uses and their latency is
+given per channel use.
+
+ - tree.*:      quantile, PMF and rotate of a SplayTree posterior after 2L
+                channel uses of a message of length L. The node inserted by
+                quantile is removed after timing, so the tree stays the same
+ - hamming.*:   encode/detectError of the string codec and its int version
+ - channel.*:   MPMS.channel_transmit of a Hamming block, string and int
+ - pms/mpms.*:  PMS.transmit and MPMS.transmit of whole messages
+
+Results can be saved as a JSON baseline and compared with a later run, a
+benchmark regressed if its operations per second dropped by more than the
+tolerance:
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json
+
+Messages come from a MessageSource, so no corpus is needed.
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from pms import PMS
+from mpms import MPMS
+from hamming import HammingCode
+from messages import MessageSource
+
+LENGTHS = (10, 20, 40) # message lengths
+CROSSOVER = (0.05, 0.1, 0.3) # crossover probabilities
+HAMMING = (4, 11) # hamming message lengths
+Pe = 0.01
+REPEAT = 2000 # timed calls of each operation
+SAMPLES = 20 # timed transmissions of each length and crossover probability
+MEMORY_REPEAT = 20 # calls under tracemalloc
+WARMUP = 10
+TOLERANCE = 0.2 # allowed drop of operations per second
+
+def timed(op, n, setup=None, teardown=None, warmup=WARMUP):
+    """ Latency in seconds of n calls of op(setup()), then teardown(result) """
+    clock = time.perf_counter
+    latency = np.empty(n)
+    for k in range(-warmup, n):
+        arg = setup() if setup is not None else None
+        start = clock()
+        res = op(arg)
+        end = clock()
+        if teardown is not None:
+            teardown(res)
+        if k >= 0:
+            latency[k] = end - start
+    return latency
+
+def peak_memory(op, n, setup=None, teardown=None):
+    """ Largest memory in bytes allocated by one of n calls """
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(n):
+            arg = setup() if setup is not None else None
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            res = op(arg)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+            if teardown is not None:
+                teardown(res)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def summary(latency, peak, uses=None):
+    """ Statistics of latencies, per channel use if the uses are given """
+    total = latency.sum()
+    ops = len(latency) if uses is None else uses.sum()
+    if uses is not None:
+        latency = latency / uses
+    p50, p90, p99 = np.percentile(latency, [50, 90, 99]) * 1e6
+    return {
+        'n': len(latency), 'ops_per_sec': ops / total, 'mean_us': 1e6 * total / ops,
+        'p50_us': p50, 'p90_us': p90, 'p99_us': p99, 'peak_kib': peak / 1024,
+    }
+
+def measure(op, n, setup=None, teardown=None):
+    latency = timed(op, n, setup, teardown)
+    peak = peak_memory(op, min(n, MEMORY_REPEAT), setup, teardown)
+    return summary(latency, peak)
+
+def posterior(L, Px, backend=None, uses=None):
+    """ PMS with the SplayTree posterior after uses channel uses, 2L by default """
+    pms = PMS(Px, 0, backend, 'splay', rng=0) # never ends with Pe = 0
+    pms.transmit(MessageSource(L)[0], max_channel_use=uses or 2*L, seq_len=L)
+    return pms
+
+def bench_tree(L, Px, backend=None, n=REPEAT):
+    pms = posterior(L, Px, backend)
+    num, rng = pms.num, np.random.default_rng(0)
+    res = {}
+    with num.context():
+        tree = pms.tree
+        def unsplit(node): # remove the leaf inserted by quantile
+            node.parent.left = node.parent.right = None
+        res['quantile'] = measure(tree.quantile, n, lambda: num.mass(rng.random()), unsplit)
+        res['PMF'] = measure(tree.PMF, n, lambda: num.value(rng.random()))
+
+        # every rotation splays a new node, like the splits of a transmission
+        root = [tree]
+        def new_node():
+            return root[0].quantile(num.mass(rng.random())).parent
+        def set_root(node):
+            root[0] = node
+        res['rotate'] = measure(lambda node: node.rotate(), n, new_node, set_root)
+    return {'tree.{}[L={},Px={}]'.format(k, L, Px): v for k, v in res.items()}
+
+def bench_hamming(k, n=REPEAT):
+    src = MessageSource(k)
+    msg = src.string(0)
+    hc = HammingCode(msg)
+    code = hc.encode()
+    received = code[:-1] + str(1 - int(code[-1])) # last bit flipped
+    x, l = src[0], hc.l
+    code_int = HammingCode.encode_int(x, k)
+    res = {
+        'encode': measure(lambda _: HammingCode(msg).encode(), n),
+        'detectError': measure(lambda _: hc.detectError(received), n),
+        'encode_int': measure(lambda _: HammingCode.encode_int(x, k), n),
+        'syndrome_int': measure(lambda _: HammingCode.syndrome_int(code_int ^ 1), n),
+    }
+    return {'hamming.{}[n={},k={}]'.format(name, l, k): v for name, v in res.items()}
+
+def bench_channel(k, Px, n=REPEAT):
+    mpms = MPMS(Px, Pe, rng=0)
+    hc = HammingCode(MessageSource(k).string(0))
+    code = hc.encode()
+    code_int = int(code, 2)
+    res = {
+        'str': measure(lambda _: mpms.channel_transmit(code), n),
+        'int': measure(lambda _: mpms.channel_transmit(code_int, None, hc.l), n),
+    }
+    return {'channel.transmit_{}[n={},Px={}]'.format(name, hc.l, Px): v for name, v in res.items()}
+
+def bench_transmit(scheme, L, Px, backend=None, structure='splay', samples=SAMPLES, hmsg_len=4):
+    """ Latency per channel use of whole transmissions of different messages """
+    src = MessageSource(L)
+    def run(i):
+        if scheme == 'pms':
+            return PMS(Px, Pe, backend, structure, rng=i).transmit(src[i], max_channel_use=500, seq_len=L)[2]
+        return MPMS(Px, Pe, backend, structure, rng=i).transmit(src[i], max_channel_use=500, msg_len=hmsg_len, seq_len=L)[1]
+    latency, uses = np.empty(samples), np.empty(samples)
+    clock = time.perf_counter
+    run(samples) # warm-up
+    for i in range(samples):
+        start = clock()
+        uses[i] = run(i)
+        latency[i] = clock() - start
+    peak = peak_memory(run, min(samples, 3), iter(range(samples)).__next__)
+    name = '{}.transmit[L={},Px={}]'.format(scheme, L, Px)
+    if scheme == 'mpms':
+        name = '{}.transmit[L={},Px={},k={}]'.format(scheme, L, Px, hmsg_len)
+    return {name: summary(latency, peak, uses)}
+
+def run_all(lengths=LENGTHS, crossover=CROSSOVER, hamming=HAMMING, backend=None, structure='splay',
+        repeat=REPEAT, samples=SAMPLES, only=None):
+    """ Run every benchmark, or those whose group is in only, e.g. ('tree',) """
+    groups = {
+        'tree': lambda: [bench_tree(L, Px, backend, repeat) for L in lengths for Px in crossover],
+        'hamming': lambda: [bench_hamming(k, repeat) for k in hamming],
+        'channel': lambda: [bench_channel(k, Px, repeat) for k in hamming for Px in crossover],
+        'pms': lambda: [bench_transmit('pms', L, Px, backend, structure, samples) for L in lengths for Px in crossover],
+        'mpms': lambda: [bench_transmit('mpms', L, Px, backend, structure, samples) for L in lengths for Px in crossover],
+    }
+    results = {}
+    for group, bench in groups.items():
+        if only is None or group in only:
+            for res in bench():
+                results.update(res)
+    return results
+
+def metadata(backend, structure):
+    return {
+        'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+        'backend': PMS(0.1, Pe, backend, structure).num.name, 'structure': structure,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def save_baseline(fn, results, meta):
+    with open(fn + '.tmp', 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1, sort_keys=True)
+    os.replace(fn + '.tmp', fn)
+
+def load_baseline(fn):
+    with open(fn, 'r') as f:
+        return json.load(f)
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """ (name, old, new ops/sec) of the benchmarks slower than the baseline by more than tolerance """
+    slower = []
+    for name, res in results.items():
+        old = baseline['results'].get(name)
+        if old is not None and res['ops_per_sec'] < (1 - tolerance) * old['ops_per_sec']:
+            slower.append((name, old['ops_per_sec'], res['ops_per_sec']))
+    return slower
+
+def report(results, baseline=None):
+    print("{:<42} {:>12} {:>9} {:>9} {:>9} {:>9} {:>8}".format('benchmark', 'ops/sec', 'p50 us', 'p90 us', 'p99 us', 'peak KiB', 'change'))
+    for name, r in results.items():
+        change = ''
+        if baseline is not None and name in baseline['results']:
+            change = '{:+.1%}'.format(r['ops_per_sec'] / baseline['results'][name]['ops_per_sec'] - 1)
+        print("{:<42} {:>12.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f} {:>8}".format(
+            name, r['ops_per_sec'], r['p50_us'], r['p90_us'], r['p99_us'], r['peak_kib'], change))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the posterior tree, Hamming codec and transmissions")
+    parser.add_argument('--save', help="write the results as a baseline to this file")
+    parser.add_argument('--compare', help="compare the results with this baseline, exit with 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed drop of ops/sec")
+    parser.add_argument('--backend', help="numeric backend, the PMS default if not given")
+    parser.add_argument('--structure', default='splay', help="structure of the transmissions")
+    parser.add_argument('--only', nargs='+', help="groups to run: tree hamming channel pms mpms")
+    parser.add_argument('--quick', action='store_true', help="fewer lengths, probabilities and repeats")
+    args = parser.parse_args()
+
+    settings = {'backend': args.backend, 'structure': args.structure, 'only': args.only}
+    if args.quick:
+        settings.update(lengths=(10, 20), crossover=(0.1,), repeat=200, samples=5)
+    results = run_all(**settings)
+    baseline = load_baseline(args.compare) if args.compare else None
+    report(results, baseline)
+    if args.save:
+        save_baseline(args.save, results, metadata(args.backend, args.structure))
+    if baseline is not None:
+        slower = compare(results, baseline, args.tolerance)
+        for name, old, new in slower:
+            print("Regression: {} {:.1f} -> {:.1f} ops/sec".format(name, old, new))
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,112 @@
+'''
+Channel capacities and Hamming code error probabilities
+
+Every function takes scalars or arrays of crossover probabilities and code
+parameters and broadcasts them like numpy. Calls on scalars return floats
+and are memoized per process, so MPMS and the plots never compute the same
+value twice. capacity_grid() gives every value for a grid of crossover
+probabilities and Hamming message lengths in one call, also memoized.
+
+ - h(x):                          binary entropy
+ - BSC_capacity(alpha):           capacity of the BSC
+ - BSC_Hamming_capacity(n, k, rho): capacity of the BSC with a Hamming(n, k)
+                                  code whose message error probability is rho
+ - hamming_err_prob(Px, k, n):    probability that a Hamming(n, k) code has
+                                  more errors than it can correct
+ - hamming_LOEP(Px, n):           leading order of hamming_err_prob
+'''
+
+import inspect
+from functools import lru_cache, wraps
+import numpy as np
+from scipy.special import comb
+
+# minimum distance of the Hamming codes
+HAMMING_DISTANCE = 3
+
+def memoized(f):
+    """ Memoize the calls of f on scalars, arrays are computed directly """
+    cached = lru_cache(maxsize=None)(f)
+    signature = inspect.signature(f)
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if kwargs: # as positional arguments, to share their cache entries
+            args = signature.bind(*args, **kwargs).args
+        if all(np.ndim(a) == 0 for a in args):
+            return float(cached(*args))
+        return f(*args)
+    wrapper.cache_info, wrapper.cache_clear = cached.cache_info, cached.cache_clear
+    return wrapper
+
+# entropy function
+@memoized
+def h(x):
+    x = np.asarray(x, dtype=np.float64)
+    return x * np.log2(1/x) + (1-x) * np.log2(1/(1-x))
+
+# capacity
+@memoized
+def BSC_capacity(alpha):
+    return 1 - h(alpha)
+
+@memoized
+def BSC_Hamming_capacity(n, k, rho):
+    """
+    n:   hamming block length
+    k:   hamming message length
+    rho: error probability, P(u_k != v_k)
+    C = I(u_k, v_k) / n = (H(v_k) - H(v_k|u_k)) / n
+    """
+    rho, k = np.asarray(rho, dtype=np.float64), np.asarray(k)
+    H_vk_given_uk = (1-rho) * np.log2(1/(1-rho)) + rho * np.log2((2.0**k-1) / rho)
+    return (k - H_vk_given_uk) / n
+
+# hamming code error probability
+@memoized
+def hamming_err_prob(Px, msg_len, block_len):
+    Px, n = np.asarray(Px, dtype=np.float64), np.asarray(block_len)
+    sum_p = 0
+    for i in range(HAMMING_DISTANCE//2 + 1):
+        sum_p = sum_p + comb(n, i) * Px**i * (1-Px)**(n-i)
+    return 1 - sum_p
+
+@memoized
+def hamming_LOEP(Px, block_len):
+    """ Error probability of leading order"""
+    Px = np.asarray(Px, dtype=np.float64)
+    return 3 * comb(block_len, 2) * Px * Px / block_len
+
+def block_length(msg_len):
+    """ Hamming block length of message lengths """
+    k = np.asarray(msg_len)
+    r = np.zeros(k.shape, dtype=np.int64)
+    while np.any(2**r < k + r + 1):
+        r += 2**r < k + r + 1
+    return k + r
+
+@lru_cache(maxsize=None)
+def _grid(Px, msg_lens, estimate):
+    p, k = np.array(Px)[:, None], np.array(msg_lens)[None, :]
+    n = block_length(k)
+    rho = hamming_LOEP(p, n) if estimate == 'LOEP' else hamming_err_prob(p, k, n)
+    grid = {
+        'bsc': np.broadcast_to(BSC_capacity(p), rho.shape),
+        'block_len': np.broadcast_to(n, rho.shape),
+        'err_prob': rho,
+        'hamming': BSC_Hamming_capacity(n, k, rho),
+    }
+    for a in grid.values():
+        a.setflags(write=False)
+    return grid
+
+def capacity_grid(Px, msg_lens, estimate='HEP'):
+    """ Capacities over crossover probabilities Px and Hamming message lengths
+
+    Return a dict of arrays of shape (len(Px), len(msg_lens)): bsc, the BSC
+    capacity; block_len; err_prob, the error probability of the code, from
+    hamming_err_prob, or hamming_LOEP if estimate is 'LOEP'; hamming, the
+    capacity with the code. The arrays are shared between calls, read only.
+    """
+    Px = tuple(float(p) for p in np.atleast_1d(Px))
+    msg_lens = tuple(int(k) for k in np.atleast_1d(msg_lens))
+    return _grid(Px, msg_lens, estimate)
@@ -0,0 +1,80 @@
+'''
+Channel models
+
+A channel draws its noise from a random generator in blocks and returns the
+noise of many bits at once as boolean flip masks, of shape (number of codes,
+code length). Codes are ints read from the code strings, so the flip of
+string index k is bit length-1-k of the mask, and a code is transmitted by
+xoring it with its mask.
+
+ - BSC: binary symmetric channel, every bit flips with the crossover
+        probability. num_err caps the bits that can flip: that many positions
+        are picked at random in each code and only they are exposed to noise.
+'''
+
+import numpy as np
+from errors import ChannelError
+
+# noise is drawn from the generator in blocks of this size
+NOISE_BLOCK = 64
+
+class Channel():
+    def __init__(self, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.noise, self.noise_pos = np.empty(0), 0
+
+    def uniform(self, n=1):
+        """ Next n uniform numbers of the noise stream """
+        if self.noise_pos + n > len(self.noise):
+            block = self.rng.random(max(n, NOISE_BLOCK))
+            self.noise = np.concatenate((self.noise[self.noise_pos:], block))
+            self.noise_pos = 0
+        u = self.noise[self.noise_pos:self.noise_pos+n]
+        self.noise_pos += n
+        return u
+
+    def flips(self, number, length, num_err=None):
+        raise NotImplementedError
+
+    @staticmethod
+    def pack(flips):
+        """ Flip masks of shape (number, length) to ints """
+        length = flips.shape[1]
+        if length < 63:
+            return flips.astype(np.int64) @ (1 << np.arange(length - 1, -1, -1, dtype=np.int64))
+        return [int((row.astype(np.uint8) + ord('0')).tobytes(), 2) for row in flips]
+
+    def masks(self, number, length, num_err=None):
+        """ Flip masks of number codes as ints """
+        return self.pack(self.flips(number, length, num_err))
+
+    def transmit(self, codes, length, num_err=None):
+        """ Received words of int codes of length bits """
+        masks = self.masks(len(codes), length, num_err)
+        return [int(c) ^ int(m) for c, m in zip(codes, masks)]
+
+class BSC(Channel):
+    def __init__(self, crossover_prob, rng=None):
+        super().__init__(rng)
+        self.XoverP = crossover_prob # crossover probability
+
+    def send(self, x):
+        """ Transmit a single bit """
+        return 1 - x if self.uniform()[0] < self.XoverP else x
+
+    def flips(self, number, length, num_err=None):
+        n = num_err if num_err is not None else length # number of error
+        if n > length:
+            raise ChannelError("The number of errors is larger than the code length", length=length, num_err=n)
+        if n == length:
+            flags = np.ones((number, length), dtype=bool)
+        else:
+            # the n positions of the smallest random keys in each code
+            keys = self.rng.random((number, length))
+            flags = np.zeros((number, length), dtype=bool)
+            np.put_along_axis(flags, np.argsort(keys, axis=1)[:, :n], True, axis=1)
+        # one uniform number per bit, only flagged bits can be flipped
+        u = self.uniform(number * length).reshape(number, length)
+        return flags & (u < self.XoverP)
+
+CHANNELS = {'bsc': BSC}
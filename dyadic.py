@@ -0,0 +1,176 @@
+'''
+Exact store for maintaining probability, for the standard PMS
+ - starts: interval boundaries as ints, boundary j is starts[j] / 2^shift
+ - exps:   exponent of each channel factor in the mass of every interval,
+           one list per factor
+
+ Same contract as IntervalArray in interval.py:
+ quantile(p) -> x
+ PMF(x) -> p
+ PMF_pair(x1, x2) -> p1, p2
+ split(p) -> root, x, width
+ rescale(xs, masses)
+ compact(length, threshold, keep) -> removed
+ size(), depth()
+
+ Masses given to rescale are fractions, scaled by a common denominator to
+ small int factors, e.g. 9 and 1 for 9/10 and 1/10. Each interval keeps the
+ number of times its density was multiplied by each factor, so its weight
+ length * prod(factor^exp) is an int and no number is ever rounded. The
+ weights are cached and the probabilities are the weights over their sum.
+ Rescaling multiplies every region by its mass: the likelihood update of
+ the standard PMS. Cuts are put on the dyadic grid CUT_BITS below the width
+ of the interval they split, so split(p) is within 2^-CUT_BITS of the mass
+ of that interval from p, and the shift only grows when intervals narrow.
+ Results are returned as Fraction, it runs with the fraction backend.
+'''
+
+import bisect
+from itertools import accumulate
+from fractions import Fraction
+from math import lcm
+
+# bits of resolution of a cut inside the interval it splits
+CUT_BITS = 128
+
+class DyadicIntervals():
+    def __init__(self, starts, shift, num=None):
+        self.starts = list(starts) # the last interval ends at 1 << shift
+        self.shift = shift
+        self.factors = {} # int factor -> index in exps
+        self.exps = []
+        self.weights = [b - a for a, b in zip(self.starts, self.starts[1:] + [1 << shift])]
+
+    @classmethod
+    def unit(cls, num=None):
+        """ Uniform probability on [0, 1] split at 1/2 """
+        return cls([0, 1], 1, num)
+
+    def to_int(self, x):
+        """ Boundary x as an int at the shift, x must be a boundary """
+        x = Fraction(x)
+        return x.numerator << (self.shift - x.denominator.bit_length() + 1)
+
+    def length(self, j):
+        end = self.starts[j+1] if j + 1 < len(self.starts) else 1 << self.shift
+        return end - self.starts[j]
+
+    def refine(self, bits):
+        """ Move every boundary bits further from the binary point """
+        self.shift += bits
+        self.starts = [s << bits for s in self.starts]
+        self.weights = [w << bits for w in self.weights]
+
+    def locate(self, p):
+        """ Interval j holding the quantile p, the weight before it and the total """
+        p = Fraction(p)
+        cum = list(accumulate(self.weights, initial=0))
+        total = cum[-1]
+        # first interval whose end is above p * total
+        j = min(bisect.bisect_right(cum, p.numerator * total // p.denominator, 1) - 1, len(self.weights) - 1)
+        return j, cum[j], total
+
+    def quantile(self, p):
+        p = Fraction(p)
+        j, cum, total = self.locate(p)
+        # exact position in interval j, whose density is weight / length
+        density = Fraction(self.weights[j], self.length(j))
+        offset = (p * total - cum) / density
+        return (self.starts[j] + offset) / (1 << self.shift)
+
+    def PMF_pair(self, x1, x2):
+        scale = 1 << self.shift
+        cum = list(accumulate(self.weights, initial=0))
+        res = []
+        for x in (x1, x2):
+            x = Fraction(x) * scale
+            # the interval starting at or below the floor of x holds x
+            j = max(bisect.bisect_right(self.starts, x.numerator // x.denominator) - 1, 0)
+            part = (x - self.starts[j]) * Fraction(self.weights[j], self.length(j))
+            res.append((cum[j] + part) / cum[-1])
+        return res[0], res[1]
+
+    def PMF(self, x):
+        return self.PMF_pair(x, x)[0]
+
+    def size(self):
+        """ Number of boundaries """
+        return len(self.starts) + 1
+
+    def depth(self):
+        """ Steps of the binary search of an interval """
+        return (len(self.starts) - 1).bit_length()
+
+    def split(self, p, lap=None):
+        p = Fraction(p)
+        j, cum, total = self.locate(p)
+        scale = 1 << self.shift
+        if p.denominator * cum == p.numerator * total and j > 0: # already a boundary
+            return self, Fraction(self.starts[j], scale), Fraction(self.length(j), scale)
+
+        # cut on a grid CUT_BITS below the width of the interval
+        bits = max(0, CUT_BITS - self.length(j).bit_length())
+        if bits:
+            self.refine(bits)
+            cum, total = cum << bits, total << bits
+        n, w = self.length(j), self.weights[j]
+        t = ((p.numerator * total - p.denominator * cum) * n) // (p.denominator * w)
+        t = min(max(t, 1), n - 1)
+        if lap is not None:
+            lap('quantile')
+
+        density = w // n
+        self.starts.insert(j+1, self.starts[j] + t)
+        for e in self.exps:
+            e.insert(j+1, e[j])
+        self.weights[j:j+1] = [t * density, (n - t) * density]
+        scale = 1 << self.shift
+        if lap is not None:
+            lap('insert')
+        return self, Fraction(self.starts[j+1], scale), Fraction(min(t, n - t), scale)
+
+    def rescale(self, xs, masses):
+        """ Multiply the probability between consecutive cuts xs by masses
+
+        xs must be sorted existing boundaries and masses has one more element
+        than xs. Return None: the cumulative probability is not rescaled
+        affinely between cuts, so callers must recompute it.
+        """
+        masses = [Fraction(m) for m in masses]
+        common = lcm(*(m.denominator for m in masses))
+        factors = [m.numerator * (common // m.denominator) for m in masses]
+        edges = [0] + [bisect.bisect_left(self.starts, self.to_int(x)) for x in xs] + [len(self.starts)]
+        w = self.weights
+        for f, lo, hi in zip(factors, edges, edges[1:]):
+            if f == 1:
+                continue
+            if f not in self.factors:
+                self.factors[f] = len(self.exps)
+                self.exps.append([0] * len(w))
+            e = self.exps[self.factors[f]]
+            e[lo:hi] = [k + 1 for k in e[lo:hi]]
+            w[lo:hi] = [v * f for v in w[lo:hi]]
+        return None
+
+    def compact(self, length=None, threshold=0, keep=()):
+        """ Merge neighbouring intervals of the same density
+
+        Merging them leaves every probability the same. length and threshold
+        are not used, merging on them would not be exact. Boundaries in keep
+        are never removed. Return the number of removed boundaries.
+        """
+        keep = {self.to_int(x) for x in keep}
+        exps = list(zip(*self.exps)) if self.exps else [()] * len(self.starts)
+        kept = [0]
+        weights = [self.weights[0]]
+        for j in range(1, len(self.starts)):
+            if exps[j] == exps[kept[-1]] and self.starts[j] not in keep:
+                weights[-1] += self.weights[j]
+                continue
+            kept.append(j)
+            weights.append(self.weights[j])
+        removed = len(self.starts) - len(kept)
+        self.starts = [self.starts[j] for j in kept]
+        self.exps = [[e[j] for j in kept] for e in self.exps]
+        self.weights = weights
+        return removed
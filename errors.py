@@ -0,0 +1,34 @@
+'''
+Exceptions of the schemes
+
+Every exception carries the state needed to diagnose it as keyword
+attributes in state, e.g. the boundaries of the nodes of a broken rotation,
+and can be pickled to be sent back from a worker process.
+
+ - PMSError:         base class
+ - TreeError:        inconsistent tree structure in a rotation
+ - MessageError:     message or code of the wrong length
+ - ChannelError:     more errors requested than the code has bits
+'''
+
+class PMSError(Exception):
+    def __init__(self, message, **state):
+        super().__init__(message)
+        self.state = state
+
+    def __str__(self):
+        if not self.state:
+            return self.args[0]
+        return '{} ({})'.format(self.args[0], ', '.join('{}={}'.format(k, v) for k, v in self.state.items()))
+
+    def __reduce__(self):
+        return type(self), (self.args[0],), {'state': self.state}
+
+class TreeError(PMSError):
+    pass
+
+class MessageError(PMSError, ValueError):
+    pass
+
+class ChannelError(PMSError, ValueError):
+    pass
@@ -1,15 +1,24 @@
 import os
 import numpy as np
+from utility import write_msg, msg_file
+from messages import MessageSource
 
 min_len = 1
 max_len = 200
 sample_size = 1000
+write_text = False # also write the old text corpus
+source_seed = None # write the messages of MessageSource(l, source_seed)
 
 np.random.seed(0)
+os.makedirs('message', exist_ok=True)
 for l in range(min_len, max_len+1):
-    fn = 'msg_{}.txt'.format(l)
-    fn = os.path.join('message',fn)
-    with open(fn, 'w') as f:
-        for i in range(sample_size):
-            msg = np.random.randint(2, size=l)
-            f.write(''.join(map(str,msg))+'\n')
+    if source_seed is None:
+        msgs = np.array([np.random.randint(2, size=l) for i in range(sample_size)])
+    else:
+        src = MessageSource(l, source_seed)
+        msgs = np.array([src.bits(i) for i in range(sample_size)])
+    write_msg(l, msgs)
+    if write_text:
+        with open(msg_file(l, 'txt'), 'w') as f:
+            for msg in msgs:
+                f.write(''.join(map(str,msg))+'\n')
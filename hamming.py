@@ -1,91 +1,224 @@
 '''
 Implement of Hamming Code
-'''     
+
+Codes are strings of '0'/'1'. Bit i of the position numbering used by the
+Hamming code (1-indexed, parity bits at powers of 2) is the character at
+index n - i of the code string, the message is spread over the other
+positions from its last character on. The generator and parity check
+matrices are built once per message length in this bit order, so encoding
+and error detection are single matrix operations, and the *_batch methods
+work on many codes at once as uint8 arrays of shape (number, bits). For
+short codes, codebook() tabulates every message and received word so that
+encoding and decoding are lookups. The *_int methods work on codes packed
+into ints read from the code strings, so bit p-1 is the position p.
+'''
+
+from functools import lru_cache
+import numpy as np
+
+def str_to_bits(s):
+    """ '0'/'1' string to uint8 array """
+    return np.frombuffer(s.encode('ascii'), dtype=np.uint8) - ord('0')
+
+def bits_to_str(bits):
+    """ uint8 array of 0/1 to string """
+    return (np.asarray(bits, dtype=np.uint8) + ord('0')).tobytes().decode('ascii')
+
+class Codebook():
+    """ Every codeword and received word of a code, as integers
+
+    Integers are read from the code strings, so bit p-1 of a codeword is the
+    Hamming position p.
+    encode[m]:      codeword of message m
+    syndrome[v]:    error position of received word v, 0 if none
+    correction[s]:  mask flipping error position s, 0 if s is 0 or beyond n
+    decode[v]:      message of v after correcting it, -1 if undecodable
+    """
+    def __init__(self, length):
+        G, H, data_idx, parity_idx = HammingCode.tables(length)
+        self.k, self.n = length, G.shape[1]
+        k, n = self.k, self.n
+
+        # codewords: xor of the rows of G selected by the message bits
+        rows = HammingCode.int_tables(length)[0]
+        msgs = np.arange(2**k, dtype=np.int64)
+        self.encode = np.zeros(2**k, dtype=np.int64)
+        for t, row in enumerate(rows):
+            self.encode ^= ((msgs >> (k - 1 - t)) & 1) * row
+
+        # syndromes: xor of the positions of the 1 bits
+        words = np.arange(2**n, dtype=np.int64)
+        self.syndrome = np.zeros(2**n, dtype=np.int64)
+        for p in range(1, n + 1):
+            self.syndrome ^= ((words >> (p - 1)) & 1) * p
+        self.correction = np.array([1 << (s - 1) if 0 < s <= n else 0 for s in range(2**H.shape[0])], dtype=np.int64)
+
+        # decoding: correct, then gather the message bits
+        fixed = words ^ self.correction[self.syndrome]
+        self.decode = np.zeros(2**n, dtype=np.int64)
+        for t, i in enumerate(data_idx):
+            self.decode |= ((fixed >> (n - 1 - i)) & 1) << (k - 1 - t)
+        self.decode[self.syndrome > n] = -1
+        for a in (self.encode, self.syndrome, self.correction, self.decode):
+            a.setflags(write=False)
 
 class HammingCode():
+    # codebooks are only built up to this block length, 2**n entries each:
+    # the (15, 11) code takes 0.5 MiB, every extra bit doubles it, longer
+    # codes use encode_int and syndrome_int
+    MAX_CODEBOOK_LEN = 16
+
     @staticmethod
-    def calc_redundant_bits(length): 
+    def calc_redundant_bits(length):
         i = 0
         while 2**i < length + i + 1:
             i += 1
-        return i 
-    
+        return i
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def tables(length):
+        """ Matrices and index tables of the code for a message length
+
+        G:          generator matrix, code = msg @ G % 2
+        H:          parity check matrix, syndrome bits = H @ code % 2
+        data_idx:   code index of each message bit
+        parity_idx: code index of each parity bit
+        """
+        r = HammingCode.calc_redundant_bits(length)
+        n = length + r
+        pos = n - np.arange(n) # position of each code index
+        data_pos = [p for p in range(1, n + 1) if p & (p - 1)][::-1]
+        data_idx = np.array([n - p for p in data_pos], dtype=np.intp)
+        parity_idx = np.array([n - 2**i for i in range(r)], dtype=np.intp)
+
+        H = np.array([(pos >> i) & 1 for i in range(r)], dtype=np.uint8).reshape(r, n)
+        G = np.zeros((length, n), dtype=np.uint8)
+        for t, p in enumerate(data_pos):
+            G[t, n - p] = 1
+            for i in range(r):
+                if p >> i & 1:
+                    G[t, parity_idx[i]] = 1
+        for a in (G, H, data_idx, parity_idx):
+            a.setflags(write=False)
+        return G, H, data_idx, parity_idx
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def codebook(length):
+        """ Codebook of a message length, built once per process """
+        n = length + HammingCode.calc_redundant_bits(length)
+        if n > HammingCode.MAX_CODEBOOK_LEN:
+            raise ValueError("No codebook for block length {} > {}".format(n, HammingCode.MAX_CODEBOOK_LEN))
+        return Codebook(length)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def int_tables(length):
+        """ Rows of the generator matrix as ints and int bit of each message bit """
+        G, H, data_idx, parity_idx = HammingCode.tables(length)
+        n = G.shape[1]
+        rows = tuple(int(bits_to_str(g), 2) for g in G)
+        data_bits = tuple(n - 1 - int(i) for i in data_idx)
+        return rows, data_bits
+
+    @classmethod
+    def encode_int(cls, msg, length):
+        """ Codeword of the int message msg of length bits """
+        code = 0
+        for t, row in enumerate(cls.int_tables(length)[0]):
+            if msg >> (length - 1 - t) & 1:
+                code ^= row
+        return code
+
+    @staticmethod
+    def syndrome_int(code):
+        """ Error position of an int code, 0 if none """
+        err_pos = 0
+        while code:
+            low = code & -code
+            err_pos ^= low.bit_length()
+            code ^= low
+        return err_pos
+
+    @classmethod
+    def decode_int(cls, code, length):
+        """ Int message of an int code, without correcting it """
+        msg = 0
+        for b in cls.int_tables(length)[1]:
+            msg = msg << 1 | (code >> b & 1)
+        return msg
+
     def __init__(self, seq, receive=None):
         self.X = seq
         self.Y = receive
         self.r = self.calc_redundant_bits(len(seq))
         self.l = len(seq) + self.r
+        self.G, self.H, self.data_idx, self.parity_idx = self.tables(len(seq))
 
     def encode(self):
-        msg = self.loc_redundant_bits()
-        # print(msg)
-        msg = self.calcParityBits(msg)
-        # print(msg)
-        self.code = msg
-        return msg
+        msg = str_to_bits(self.X) @ self.G % 2
+        self.code = bits_to_str(msg)
+        return self.code
 
     def loc_redundant_bits(self):
-        seq = self.X 
-        r = self.r
-        j = 0
-        k = 1
-        m = len(seq) 
-        res = '' 
-
-        for i in range(1, m + r + 1): 
-            if i == 2**j: 
-                res = res + '0'
-                j += 1
-            else: 
-                res = res + seq[-1 * k] 
-                k += 1
-
-        return res[::-1] 
-
-    def calcParityBits(self, arr): 
-        r = self.r
-        n = len(arr) 
-
-        for i in range(r): 
-            val = 0
-            for j in range(1, n + 1): 
-                if j & (2**i) == (2**i): 
-                    val = val ^ int(arr[-1 * j]) 
-                    # -1 * j is given since array is reversed 
-
-            # String Concatenation 
-            # (0 to n - 2^r) + parity bit + (n - 2^r + 1 to n) 
-            arr = arr[:n-(2**i)] + str(val) + arr[n-(2**i)+1:] 
-        return arr 
-
-    def detectError(self, arr, nr=None): 
-        if nr is None:
-            nr = self.r
-        
-        n = len(arr) 
-        res = 0 # binary sequence
+        res = np.zeros(self.l, dtype=np.uint8)
+        res[self.data_idx] = str_to_bits(self.X)
+        return bits_to_str(res)
 
-        for i in range(nr): 
-            val = 0
-            for j in range(1, n + 1): 
-                if j & (2**i) == (2**i): 
-                    val = val ^ int(arr[-1 * j])
+    def calcParityBits(self, arr):
+        bits = str_to_bits(arr).copy()
+        # parity positions are 0 in arr and each is covered by one check only
+        bits[self.parity_idx] = self.H @ bits % 2
+        return bits_to_str(bits)
 
-            res = res + val*(10**i)
+    def detectError(self, arr, nr=None):
+        if nr is None:
+            nr = self.r
 
-        # Convert binary to decimal 
-        err_pos = int(str(res), 2)
+        # syndrome: xor of the positions of all 1 bits
+        n = len(arr)
+        pos = n - np.flatnonzero(str_to_bits(arr))
+        err_pos = int(np.bitwise_xor.reduce(pos, initial=0)) & (2**nr - 1)
         return err_pos
 
     def decode(self, c=None):
         if c is None:
             c = self.code[::-1]
-        
-        m = ''    
-        j = 0
-        for i in range(1, len(c)+1):
-            if i == 2**j:
-                j += 1
-            else:
-                m += c[i-1]
-        return m[::-1]
\ No newline at end of file
+
+        return bits_to_str(str_to_bits(c[::-1])[self.data_idx])
+
+    @classmethod
+    def encode_batch(cls, msgs):
+        """ Encode messages of shape (number, msg length) """
+        msgs = np.asarray(msgs, dtype=np.uint8)
+        G = cls.tables(msgs.shape[1])[0]
+        return (msgs @ G % 2).astype(np.uint8)
+
+    @classmethod
+    def syndrome_batch(cls, codes, length):
+        """ Error positions of codes of shape (number, block length), 0 if none """
+        H = cls.tables(length)[1]
+        bits = np.asarray(codes, dtype=np.uint8) @ H.T % 2
+        return bits.astype(np.int64) @ (1 << np.arange(H.shape[0]))
+
+    @classmethod
+    def correct_batch(cls, codes, length):
+        """ Flip the detected error bit of each code
+
+        Return corrected codes and a mask of codes whose error position is
+        beyond the block length, which are left as they are.
+        """
+        codes = np.array(codes, dtype=np.uint8)
+        n = codes.shape[1]
+        err_pos = cls.syndrome_batch(codes, length)
+        undecodable = err_pos > n
+        rows = np.flatnonzero((err_pos > 0) & ~undecodable)
+        codes[rows, n - err_pos[rows]] ^= 1
+        return codes, undecodable
+
+    @classmethod
+    def decode_batch(cls, codes, length):
+        """ Messages of codes of shape (number, block length) """
+        data_idx = cls.tables(length)[2]
+        return np.asarray(codes, dtype=np.uint8)[:, data_idx]
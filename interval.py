@@ -0,0 +1,127 @@
+'''
+Array-backed store for maintaining probability, alternative to the trees
+ - breaks: sorted interval boundaries, breaks[0] = 0 and breaks[-1] = 1
+ - cum:    cumulative probability at each boundary
+
+ Same contract as the trees in tree.py:
+ quantile(p) -> x
+ PMF(x) -> p
+ PMF_pair(x1, x2) -> p1, p2
+ split(p) -> root, x, width
+ rescale(xs, masses)
+ compact(length, threshold, keep) -> removed
+ size(), depth()
+
+ Boundaries and probabilities are kept as float64 in contiguous arrays, which
+ grow by doubling, so it only runs with the float64 numeric backend.
+'''
+
+import numpy as np
+
+class IntervalArray():
+    def __init__(self, breaks, cum, num=None):
+        n = len(breaks)
+        self.n = n # number of boundaries in use
+        self.breaks = np.zeros(max(2*n, 16))
+        self.cum = np.zeros(max(2*n, 16))
+        self.breaks[:n], self.cum[:n] = breaks, cum
+
+    @classmethod
+    def unit(cls, num=None):
+        """ Uniform probability on [0, 1] split at 1/2 """
+        return cls([0, 0.5, 1], [0, 0.5, 1], num)
+
+    def locate(self, p):
+        """ Index i of the interval with cum[i] <= p < cum[i+1] """
+        i = np.searchsorted(self.cum[:self.n], p, side='right') - 1
+        return min(max(i, 0), self.n - 2)
+
+    def quantile(self, p):
+        i = self.locate(p)
+        b, c = self.breaks, self.cum
+        return float(b[i] + (b[i+1] - b[i]) * (p - c[i]) / (c[i+1] - c[i]))
+
+    def PMF(self, x):
+        n, b, c = self.n, self.breaks, self.cum
+        i = min(max(np.searchsorted(b[:n], x, side='right') - 1, 0), n - 2)
+        return float(c[i] + (c[i+1] - c[i]) * (x - b[i]) / (b[i+1] - b[i]))
+
+    def PMF_pair(self, x1, x2):
+        n, b, c = self.n, self.breaks, self.cum
+        i = np.searchsorted(b[:n], (x1, x2), side='right') - 1
+        i = np.clip(i, 0, n - 2)
+        p = c[i] + (c[i+1] - c[i]) * ((x1, x2) - b[i]) / (b[i+1] - b[i])
+        return float(p[0]), float(p[1])
+
+    def size(self):
+        """ Number of boundaries """
+        return self.n
+
+    def depth(self):
+        """ Steps of the binary search of an interval """
+        return (self.n - 2).bit_length()
+
+    def split(self, p, lap=None):
+        i = self.locate(p)
+        if self.cum[i] == p: # already a boundary
+            return self, float(self.breaks[i]), float(self.breaks[i+1] - self.breaks[i])
+        x = self.quantile(p)
+        if lap is not None:
+            lap('quantile')
+        if self.n == len(self.breaks):
+            self.breaks = np.concatenate((self.breaks, np.zeros(self.n)))
+            self.cum = np.concatenate((self.cum, np.zeros(self.n)))
+        # shift the right part by one and insert the new boundary
+        n = self.n
+        self.breaks[i+2:n+1] = self.breaks[i+1:n]
+        self.cum[i+2:n+1] = self.cum[i+1:n]
+        self.breaks[i+1], self.cum[i+1] = x, p
+        self.n += 1
+        width = min(x - self.breaks[i], self.breaks[i+2] - x)
+        if lap is not None:
+            lap('insert')
+        return self, x, float(width)
+
+    def rescale(self, xs, masses):
+        """ Scale the probability between consecutive cuts xs to masses
+
+        xs must be sorted existing boundaries, masses has one more element
+        than xs and sums to 1. Return the cumulative probability at xs before
+        rescaling.
+        """
+        n, c = self.n, self.cum
+        idx = np.searchsorted(self.breaks[:n], xs)
+        cdf = [float(c[i]) for i in idx]
+        edges = [0] + list(idx) + [n-1]
+        old = c[edges]
+        base = 0
+        for r, m in enumerate(masses):
+            lo, hi = edges[r], edges[r+1]
+            if old[r+1] > old[r]: # cuts closer than the precision leave empty regions
+                c[lo:hi] = base + (c[lo:hi] - old[r]) * (m / (old[r+1] - old[r]))
+            base += m
+        c[n-1] = 1
+        return cdf
+
+    def compact(self, length=None, threshold=0, keep=()):
+        """ Remove boundaries inside one message interval or of small mass
+
+        From left to right, a boundary is removed if the interval it would
+        merge into lies inside one interval [k/2^length, (k+1)/2^length] or
+        has mass below threshold. Boundaries in keep are never removed.
+        Return the number of removed boundaries.
+        """
+        n, b, c = self.n, self.breaks, self.cum
+        scale = 2**length if length is not None else None
+        kept = [0]
+        for j in range(1, n - 1):
+            lo = kept[-1]
+            inside = scale is not None and b[j+1] * scale <= int(b[lo] * scale) + 1
+            if (inside or c[j+1] - c[lo] < threshold) and b[j] not in keep:
+                continue
+            kept.append(j)
+        kept.append(n - 1)
+        m = len(kept)
+        b[:m], c[:m] = b[kept], c[kept]
+        self.n = m
+        return n - m
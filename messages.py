@@ -0,0 +1,63 @@
+'''
+Streaming message source
+
+Message i of length L is generated on demand from a Philox counter-based
+generator: the key depends on the seed and L, the counter on i. So any
+message can be produced without the ones before it, the same seed always
+gives the same messages, and nothing has to be stored. gen_msg.py can
+write the same messages as a fixed corpus.
+
+Messages are ints of L bits, like read_msg(L, packed=True).
+'''
+
+import numpy as np
+
+class MessageSource():
+    def __init__(self, length, seed=0, count=None):
+        self.L = length
+        self.count = count # number of messages, unbounded if None
+        self.words = (length + 63) // 64 # 64 bit words per message
+        self.steps = (self.words + 3) // 4 # philox counter steps per message
+        self.key = np.random.SeedSequence(seed, spawn_key=(length,)).generate_state(2, np.uint64)
+
+    def raw(self, start, n):
+        """ Words of messages start to start+n, shape (n, words) big-endian """
+        # each counter step gives 4 words, message i starts at step i*steps
+        raw = np.random.Philox(key=self.key, counter=start * self.steps).random_raw(4 * self.steps * n)
+        return raw.reshape(n, 4 * self.steps)[:, :self.words].astype('>u8')
+
+    def to_int(self, words):
+        return int.from_bytes(words.tobytes(), 'big') >> (64 * self.words - self.L)
+
+    def __getitem__(self, i):
+        if i < 0 or (self.count is not None and i >= self.count):
+            raise IndexError("Message {} out of range".format(i))
+        return self.to_int(self.raw(i, 1)[0])
+
+    def __len__(self):
+        if self.count is None:
+            raise TypeError("Unbounded message source")
+        return self.count
+
+    def __iter__(self):
+        i = 0
+        while self.count is None or i < self.count:
+            yield self[i]
+            i += 1
+
+    def chunks(self, size, start=0, stop=None):
+        """ Yield lists of at most size consecutive messages from start """
+        stop = stop if stop is not None else self.count
+        i = start
+        while stop is None or i < stop:
+            j = i + size if stop is None else min(i + size, stop)
+            yield [self.to_int(w) for w in self.raw(i, j - i)]
+            i = j
+
+    def bits(self, i):
+        """ Message i as a 0/1 array """
+        return np.unpackbits(self.raw(i, 1).view(np.uint8), count=self.L)
+
+    def string(self, i):
+        """ Message i as a '0'/'1' string """
+        return format(self[i], '0{}b'.format(self.L))
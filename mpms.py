@@ -19,76 +19,88 @@ Modified Posterior Matching Scheme with hamming(4,7)
         regardless of error(s) (not robust when code is long)
 '''
 
+from contextlib import ExitStack
 import numpy as np
-import bigfloat as bf
-from tree import SplayTree
 from pms import PMS
 from hamming import HammingCode
-from utility import hamming_err_prob, hamming_LOEP
+from capacity import hamming_err_prob, hamming_LOEP
+from progress import logger
+from errors import MessageError, ChannelError
+
+log = logger('mpms')
 
 class MPMS(PMS):
-    def __init__(self, crossover_prob, err_prob):
-        super().__init__(crossover_prob, err_prob)
+    def __init__(self, crossover_prob, err_prob, backend=None, structure='splay', rng=None, compact_every=None, compact_threshold=0, observer=None):
+        # the dyadic structure multiplies masses, MPMS sets them
+        if structure == 'dyadic':
+            raise ValueError("MPMS does not support the dyadic structure")
+        super().__init__(crossover_prob, err_prob, backend, structure, rng, compact_every, compact_threshold, observer)
         self.peak = 0 # peak value
 
-    # Given a bit seq, return prob' s lower\upper bound it belongs to
+    # Given a bit seq or its order, return prob' s lower\upper bound it belongs to
     def find_interval(self, y):
-        order = int(y,2) # convert to integer
         n = self.msg_len
-        if n != len(y):
-            print("ERROR! Y has invalid length:{}".format(y))
-            exit()
+        if isinstance(y, str):
+            if n != len(y):
+                raise MessageError("Y has invalid length", y=y, length=n)
+            order = int(y,2) # convert to integer
+        else:
+            order = int(y)
         # prob of intervals to be scaled up
-        unit_prob = 1 / 2**n
-        lb = bf.BigFloat(order) / 2**n
-        ub = bf.BigFloat(order + 1) / 2**n
+        lb = self.num.mass(order) / 2**n
+        ub = self.num.mass(order + 1) / 2**n
         return order, lb, ub
 
-    def channel_transmit(self, U, num_err=None):
-        a = self.XoverP
-        u = U
-        n = num_err if num_err is not None else len(u) # number of error
-        if n > len(u):
-            print("Error! The number of error(s) can't be larger than the length of code")
-            print("Length of code: {}, number of error(s): {}".format(len(u), num_err))
-            exit()
-        positions = np.random.choice(len(u), n, replace=False)
-        flags = [True if i in positions else False for i in range(len(u))]
-
-        def flip(x, f):
-            p = self.XoverP
-            x = int(x)
-            if f:
-                return 1 - x if np.random.rand() <= p else x
-            else:
+    # send code U of length bits thru the channel, U is a '0'/'1' string or
+    # an int whose bit 0 is the last character of the string
+    def channel_transmit(self, U, num_err=None, length=None):
+        packed = not isinstance(U, str)
+        l = length if packed else len(U)
+        n = num_err if num_err is not None else l # number of error
+        if n > l:
+            raise ChannelError("The number of error(s) can't be larger than the length of code", length=l, num_err=num_err)
+        if packed:
+            return self.channel.transmit([U], l, num_err)[0]
+        flips = self.channel.flips(1, l, num_err)[0]
+        v = np.frombuffer(U.encode('ascii'), dtype=np.uint8) ^ flips.astype(np.uint8)
+        return v.tobytes().decode('ascii')
+
+    # send message order x thru hamming code and channel, return the decoded
+    # message order or None if the error(s) can't be corrected
+    def hamming_transmit(self, x, err_num=None):
+        n = self.block_len
+        book = self.codebook
+        if book is not None: # table lookups
+            v = self.channel_transmit(book.encode[x], err_num, n)
+            err_pos = book.syndrome[v]
+            if err_pos == 0: # no error
                 return x
-
-        return ''.join([str(elm) for elm in list(map(flip, u, flags))])
-
-    # check transmission end
-    def check_ending(self):
-        v = self.peak
-        # boundaries of decoded real number 
-        bin_seq, order = self.real_to_bin(v, len(self.seq))
-        # bounaries of pmf
-        l = len(bin_seq)
-        prob_lower_bound = bf.BigFloat(order) / 2**l
-        prob_upper_bound = bf.BigFloat(order+1) / 2**l
-        
-        p1 = self.tree.PMF(prob_lower_bound)
-        p2 = self.tree.PMF(prob_upper_bound)
-        return True if p2 - p1 > 1 - self.errP else False
-
-    def transmit(self, seq, max_channel_use=None, err_num=None, msg_len=4):
+            elif err_pos <= n: # able to recover u from v
+                return int(book.decode[v])
+            return None
+
+        code = HammingCode.encode_int(x, self.msg_len)
+        v = self.channel_transmit(code, err_num, n)
+        err_pos = HammingCode.syndrome_int(v)
+        if err_pos == 0: # no error
+            return x
+        elif err_pos <= n: # able to recover u from v, flip the error bit
+            return HammingCode.decode_int(v ^ (1 << (err_pos - 1)), self.msg_len)
+        return None
+
+    def transmit(self, seq, max_channel_use=None, err_num=None, msg_len=4, seq_len=None):
         # PMS settings
-        self.msg_point = self.bin_to_real(seq)
-        print("Message: {}, Px: {}".format(self.msg_point, self.XoverP))
+        self.cell = None
         
         # hamming code settings
         self.msg_len = msg_len # hamming code message length
         self.redundant_bits = HammingCode.calc_redundant_bits(msg_len)
         self.block_len = msg_len + self.redundant_bits
-        print("Hamming Code ({}, {})".format(self.block_len, msg_len))
+        log.debug("Hamming Code (%d, %d)", self.block_len, msg_len)
+        if self.block_len <= HammingCode.MAX_CODEBOOK_LEN:
+            self.codebook = HammingCode.codebook(msg_len)
+        else:
+            self.codebook = None
         self.undecodable = False #TODO
         # h_err_p = self.XoverP
         # h_err_p = hamming_err_prob(self.XoverP, self.msg_len, self.block_len)
@@ -99,99 +111,96 @@ class MPMS(PMS):
 
         max_default_use = 500
         MCU = max_channel_use if max_channel_use is not None else max_default_use
-        for i in range(MCU):
-            # np.random.seed(i) # debug mode
-            # split probability tree, figure out which block msg belongs to
-            msg_pmf = self.tree.PMF(self.msg_point)
-            msg_seq, msg_order = self.real_to_bin(msg_pmf, msg_len)
-            self.X = msg_seq
-            # print("X: {}".format(self.X))
-
-            # hamming encoding:
-            h = HammingCode(self.X)
-            U = h.encode() # msg to be send thru channel
-            # print("U: {}".format(U))
-
-            # Binary Symmetric Channel transmission:
-            v = self.channel_transmit(U, err_num)
-            # print("V: {}".format(v))
-
-            # hamming decoding:
-            err_pos = h.detectError(v) # reverse order
-            if err_pos == 0: # no error
-                self.Y = self.X
-            elif err_pos <= len(v): # able to recover u from v
-                err_pos = len(v) - err_pos
-                lost_bit = '1' if v[err_pos] == '0' else '0' # flip the error bit
-                correct_v = v[:err_pos] + lost_bit + v[err_pos+1:]
-                self.Y = h.decode(correct_v[::-1])
-            else: #TODO
-                # print("Hamming code can't correct error in {} with error position".format(v, err_pos))
-                self.undecodable = True
-                # self.Y = h.decode(v) 
-                continue    
-
-            # print("Y: {}".format(self.Y))  
-
-            '''
-                Update probability: scale up the prob block msg belongs to, and
-            scale down the other prob block. Divide tree into three parts by l-
-            ower/upper bounds of Y's interval: the left part, the middle part, 
-            and the right part. Assume the crossover probability is a, so we s-
-            hould scale up P([lb, ub]) by a, and scale down P([0,lb], [ub,1]) 
-            by 1 - a. The procedures consist of two steps:
-                1. Scale down the left part and scale up the other parts.
-                2. Scale up the middle part and scale down the right part.
-                
-                Note that if either the left part or the right part is empty, 
-            the situation is the same as standard posterior matching scheme.
-            '''
-            # probability lower/upper bounds of Y's interval
-            Y_order, Y_pmf_lb, Y_pmf_ub = self.find_interval(self.Y) 
-            if Y_order == 0: # left part is empty
-                Y_node_ub = self.tree.quantile(Y_pmf_ub)
-                self.peak = Y_node_ub.start_value
-                self.tree = Y_node_ub.parent.rotate()
-                self.tree.left.p, self.tree.right.p = 1 - h_err_p, h_err_p
-            elif Y_order == 2**self.msg_len - 1: # right part is empty
-                Y_node_lb = self.tree.quantile(Y_pmf_lb)
-                self.peak = Y_node_lb.start_value
-                self.tree = Y_node_lb.parent.rotate()
-                self.tree.left.p, self.tree.right.p = h_err_p, 1 - h_err_p
-            else:
-                # nodes of lower/upper bounds of Y's interval
-                Y_node_lb = self.tree.quantile(Y_pmf_lb) 
-                Y_node_ub = self.tree.quantile(Y_pmf_ub)
-                # number of intervals in the left\right part
-                left_num = Y_order
-                right_num = 2**self.msg_len - 1 - Y_order 
+        obs = self.observer
+        lap = obs.lap if obs is not None else None
+        with ExitStack() as self.precision:
+            self.precision.enter_context(self.num.context())
+            # the message point needs the precision of the backend
+            self.msg_point = self.bin_to_real(seq, seq_len)
+            log.debug("Message: %s, Px: %s", self.msg_point, self.XoverP)
+            if obs is not None:
+                obs.start(self)
+            for i in range(MCU):
+                # split probability tree, figure out which block msg belongs to
+                msg_pmf = self.tree.PMF(self.msg_point)
+                msg_order = self.real_to_order(msg_pmf, msg_len)
+                self.X = msg_order
+                if lap: lap('PMF')
+                # print("X: {}".format(self.X))
+
+                # hamming encoding, channel and hamming decoding:
+                Y_order = self.hamming_transmit(msg_order, err_num)
+                if lap: lap('hamming')
+                if Y_order is None: #TODO
+                    self.undecodable = True
+                    if obs is not None:
+                        obs.step(self, i)
+                    continue
+                self.Y = Y_order
+
+                # print("Y: {}".format(self.Y))  
+
+                '''
+                    Update probability: scale up the prob block msg belongs to, and
+                scale down the other prob block. Divide tree into three parts by l-
+                ower/upper bounds of Y's interval: the left part, the middle part, 
+                and the right part. Assume the crossover probability is a, so we s-
+                hould scale up P([lb, ub]) by a, and scale down P([0,lb], [ub,1]) 
+                by 1 - a. The parts are cut at the quantiles of the bounds and 
+                rescaled together.
                 
-                unit_prob = bf.div(h_err_p, (2**self.msg_len - 1))
-                self.peak = (Y_node_lb.start_value + Y_node_ub.start_value) / 2
-
-                # step 1
-                self.tree = Y_node_lb.parent.rotate()
-                self.tree.left.p = unit_prob * left_num
-                self.tree.right.p = 1 - self.tree.left.p
+                    Note that if either the left part or the right part is empty, 
+                the situation is the same as standard posterior matching scheme.
+                '''
+                # probability lower/upper bounds of Y's interval
+                Y_order, Y_pmf_lb, Y_pmf_ub = self.find_interval(self.Y) 
+                if Y_order == 0: # left part is empty
+                    self.tree, Y_ub, width = self.tree.split(Y_pmf_ub, lap)
+                    self.check_precision(Y_ub, width)
+                    self.peak = Y_ub
+                    cuts = [Y_ub]
+                    masses = [self.num.mass(1 - h_err_p), self.num.mass(h_err_p)]
+                elif Y_order == 2**self.msg_len - 1: # right part is empty
+                    self.tree, Y_lb, width = self.tree.split(Y_pmf_lb, lap)
+                    self.check_precision(Y_lb, width)
+                    self.peak = Y_lb
+                    cuts = [Y_lb]
+                    masses = [self.num.mass(h_err_p), self.num.mass(1 - h_err_p)]
+                else:
+                    # lower/upper bounds of Y's interval
+                    self.tree, Y_lb, width = self.tree.split(Y_pmf_lb, lap)
+                    self.check_precision(Y_lb, width)
+                    self.tree, Y_ub, width = self.tree.split(Y_pmf_ub, lap)
+                    self.check_precision(Y_ub, width)
+                    # number of intervals in the left\right part
+                    left_num = Y_order
+                    right_num = 2**self.msg_len - 1 - Y_order 
                 
-                # step 2
-                sub = self.tree.right
-                sub.parent = None
-                self.tree.right = None
-                sub = Y_node_ub.parent.rotate()
-                sub_total = 1 - h_err_p + unit_prob * right_num
-                sub.left.p = bf.BigFloat(1 - h_err_p) / sub_total
-                sub.right.p = 1 - sub.left.p 
-                self.tree.right = sub
-                sub.parent = self.tree
-            # print("-"*80)
-
-            # self.tree.visualize()
+                    unit_prob = self.num.mass(h_err_p) / (2**self.msg_len - 1)
+                    self.peak = (Y_lb + Y_ub) / 2
+                    cuts = [Y_lb, Y_ub]
+                    masses = [unit_prob * left_num, self.num.mass(1 - h_err_p), unit_prob * right_num]
+                self.rescale(cuts, masses)
+                if lap: lap('rescale')
+                # print("-"*80)
+
+                # self.tree.visualize()
          
-            if self.check_ending():
-                bin_seq, _ = self.real_to_bin(self.peak, len(self.seq))
-                return bin_seq, i+1, self.block_len
-
-        bin_seq, _ = self.real_to_bin(self.peak, len(self.seq))
-        print("You have reached the maximum expected channel use!")
-        return bin_seq, MCU, self.block_len
\ No newline at end of file
+                ended = self.check_ending()
+                if lap: lap('check_ending')
+                if not ended:
+                    self.compact(i)
+                    if lap: lap('compact')
+                if obs is not None:
+                    obs.step(self, i)
+                if ended:
+                    if obs is not None:
+                        obs.end(self, i+1)
+                    bin_seq = self.decoded(self.peak)
+                    return bin_seq, i+1, self.block_len
+
+            if obs is not None:
+                obs.end(self, MCU)
+            bin_seq = self.decoded(self.peak)
+            log.warning("You have reached the maximum expected channel use!")
+            return bin_seq, MCU, self.block_len
\ No newline at end of file
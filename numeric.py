@@ -0,0 +1,234 @@
+'''
+Numeric backends for the probability tree
+ - float64:  python floats, fastest
+ - bigfloat: bf.BigFloat at a given precision (default)
+ - mpmath:   mpmath.mpf at a given precision (optional dependency)
+ - fraction: exact rationals. Exact on the trees but slow, as denominators
+             grow with every channel use; the dyadic structure keeps them as
+             ints
+ - log:      LogFloat probabilities, which keep the log of the probability
+             so tiny masses and complements close to one do not underflow
+             or round to one. Boundaries are float64, promoted to bf.BigFloat
+             of higher precision when intervals become too narrow
+ - adaptive: float64, promoted to higher precision when intervals become
+             too narrow to be resolved
+
+ A backend converts boundaries/lengths with value(x) and probabilities with
+ mass(p), both exactly. prob(p) converts a channel probability given as a
+ float, which is read as its shortest decimal on the backends of more than
+ 53 bits, so 0.3 is 3/10 there and only rounded to their precision.
+ Arithmetic on the converted numbers is done with plain operators.
+'''
+
+import math
+import contextlib
+from fractions import Fraction
+import bigfloat as bf
+
+# promote this many bits before the resolution limit is reached
+GUARD_BITS = 8
+
+class Backend():
+    name = None
+
+    def __init__(self, precision=53, adaptive=False, high=None):
+        self.precision = precision
+        self.adaptive = adaptive
+        self.high = high if high is not None else type(self)
+
+    def value(self, x):
+        raise NotImplementedError
+
+    def mass(self, p):
+        return self.value(p)
+
+    def prob(self, p):
+        """ Channel probability p, read as a decimal """
+        return self.mass(repr(p) if isinstance(p, float) else p)
+
+    def context(self):
+        """ Context in which arithmetic on this backend has to run """
+        return contextlib.nullcontext()
+
+    def exhausted(self, start, length):
+        """ Check if [start, start+length] is close to the resolution limit """
+        if not self.adaptive:
+            return False
+        return length * 2**(self.precision - GUARD_BITS) <= start
+
+    def promote(self):
+        """ Backend with twice the precision, None if not adaptive """
+        if not self.adaptive:
+            return None
+        return self.high(2 * self.precision, adaptive=True)
+
+    def __repr__(self):
+        return '{}(precision={}, adaptive={})'.format(type(self).__name__, self.precision, self.adaptive)
+
+class Float64Backend(Backend):
+    name = 'float64'
+
+    def __init__(self, precision=53, adaptive=False, high=None):
+        super().__init__(53, adaptive, high if high is not None else BigFloatBackend)
+
+    def value(self, x):
+        return float(x)
+
+    def prob(self, p):
+        return float(p)
+
+class BigFloatBackend(Backend):
+    name = 'bigfloat'
+
+    def value(self, x):
+        return bf.BigFloat(x)
+
+    def context(self):
+        return bf.precision(self.precision)
+
+class MPMathBackend(Backend):
+    name = 'mpmath'
+
+    def __init__(self, precision=53, adaptive=False, high=None):
+        super().__init__(precision, adaptive, high)
+        try:
+            import mpmath
+        except ImportError:
+            raise ImportError("mpmath is required for the 'mpmath' backend")
+        self.ctx = mpmath.MPContext()
+        self.ctx.prec = precision
+
+    def value(self, x):
+        return self.ctx.mpf(x)
+
+class FractionBackend(Backend):
+    name = 'fraction'
+
+    def __init__(self, precision=None, adaptive=False, high=None):
+        super().__init__(None, False, high)
+
+    def value(self, x):
+        return Fraction(x)
+
+class LogFloat():
+    """ Non-negative number stored as its natural log
+
+    Supports the arithmetic and comparisons the trees do on probabilities,
+    mixed with plain numbers. Sums use log-sum-exp, and differences
+    log-diff-exp, so 1 - p keeps its precision for p close to one. A
+    difference that would be negative by rounding is 0.
+    """
+    __slots__ = ('l',)
+
+    def __init__(self, x=0, log=None):
+        if log is not None:
+            self.l = log
+        elif isinstance(x, LogFloat):
+            self.l = x.l
+        elif x > 0:
+            self.l = math.log(x)
+        elif x == 0:
+            self.l = -math.inf
+        else:
+            raise ValueError("LogFloat of a negative number: {}".format(x))
+
+    @staticmethod
+    def of(x):
+        return x if isinstance(x, LogFloat) else LogFloat(x)
+
+    def __add__(self, other):
+        a, b = self.l, LogFloat.of(other).l
+        if a < b:
+            a, b = b, a
+        if b == -math.inf:
+            return LogFloat(log=a)
+        return LogFloat(log=a + math.log1p(math.exp(b - a)))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        a, b = self.l, LogFloat.of(other).l
+        if b == -math.inf:
+            return LogFloat(log=a)
+        if b >= a:
+            return LogFloat(0)
+        return LogFloat(log=a + math.log(-math.expm1(b - a)))
+
+    def __rsub__(self, other):
+        return LogFloat.of(other) - self
+
+    def __mul__(self, other):
+        return LogFloat(log=self.l + LogFloat.of(other).l)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        b = LogFloat.of(other).l
+        if b == -math.inf:
+            raise ZeroDivisionError("LogFloat division by zero")
+        return LogFloat(log=self.l - b)
+
+    def __rtruediv__(self, other):
+        return LogFloat.of(other) / self
+
+    def __eq__(self, other):
+        return self.l == LogFloat.of(other).l
+
+    def __lt__(self, other):
+        return self.l < LogFloat.of(other).l
+
+    def __le__(self, other):
+        return self.l <= LogFloat.of(other).l
+
+    def __gt__(self, other):
+        return self.l > LogFloat.of(other).l
+
+    def __ge__(self, other):
+        return self.l >= LogFloat.of(other).l
+
+    def __hash__(self):
+        return hash(self.l)
+
+    def __float__(self):
+        return math.exp(self.l)
+
+    def __round__(self, n=None):
+        return round(float(self), n)
+
+    def __repr__(self):
+        return 'LogFloat({})'.format(float(self))
+
+class LogBackend(Backend):
+    name = 'log'
+
+    def value(self, x):
+        if isinstance(x, LogFloat):
+            x = float(x)
+        return float(x) if self.precision <= 53 else bf.BigFloat(x)
+
+    def mass(self, p):
+        return LogFloat.of(p)
+
+    def prob(self, p):
+        return LogFloat.of(p)
+
+    def context(self):
+        if self.precision <= 53:
+            return contextlib.nullcontext()
+        return bf.precision(self.precision)
+
+BACKENDS = {b.name: b for b in (Float64Backend, BigFloatBackend, MPMathBackend, FractionBackend, LogBackend)}
+
+def get_backend(backend='bigfloat', precision=53):
+    """ Return a backend instance from its name, instances are passed through """
+    if isinstance(backend, Backend):
+        return backend
+    if backend == 'adaptive':
+        return Float64Backend(adaptive=True)
+    if backend == 'log': # boundaries need promotion on long messages
+        return LogBackend(precision, adaptive=True)
+    if backend not in BACKENDS:
+        raise ValueError("Unknown numeric backend: {}".format(backend))
+    return BACKENDS[backend](precision)
+
+DEFAULT_BACKEND = BigFloatBackend()
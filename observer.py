@@ -0,0 +1,104 @@
+'''
+Observers of transmissions
+
+A scheme created with observer=... reports every transmission to it:
+ start(scheme)     before the first channel use
+ lap(phase)        at the end of each phase of a channel use
+ step(scheme, i)   after channel use i, may read the state of the scheme
+ end(scheme, use)  after the last channel use
+
+Without an observer the transmission loops only test for None. Observer
+times the phases, from the previous lap to this one, and Recorder keeps one
+row per channel use with the phase times and the state of the posterior.
+The time spent in step is not counted in any phase.
+
+Phases of PMS: channel, rescale, quantile, rotate (rebalance for the AVL
+tree, insert for the array), check_ending and compact. MPMS has PMF and
+hamming instead of channel, and splits up to twice per channel use, so
+quantile and rotate are the sums of both splits.
+'''
+
+import json
+import time
+import numpy as np
+
+class Observer():
+    def __init__(self):
+        self.clock = time.perf_counter
+        self.laps = {} # seconds per phase of the current channel use
+        self.last = None
+
+    def start(self, scheme):
+        self.laps = {}
+        self.last = self.clock()
+
+    def lap(self, phase):
+        now = self.clock()
+        self.laps[phase] = self.laps.get(phase, 0) + now - self.last
+        self.last = now
+
+    def step(self, scheme, i):
+        self.laps = {}
+        self.last = self.clock()
+
+    def end(self, scheme, use):
+        pass
+
+def message_mass(scheme):
+    """ Posterior mass of the interval of the transmitted message """
+    L, num = scheme.seq_len, scheme.num
+    order = int(scheme.seq) if scheme.packed else int(scheme.seq, 2)
+    p1, p2 = scheme.tree.PMF_pair(num.value(order) / 2**L, num.value(order + 1) / 2**L)
+    return p2 - p1
+
+class Recorder(Observer):
+    """ Record the phases and the posterior after every channel use
+
+    Each row holds the transmission number, the channel use, the time of
+    each phase in seconds and the peak; with tree, the number of nodes and
+    the depth of the posterior; with mass, the posterior mass of the
+    transmitted message. Rows are kept every every channel uses.
+    """
+    def __init__(self, tree=True, mass=True, every=1):
+        super().__init__()
+        self.tree = tree
+        self.mass = mass
+        self.every = every
+        self.rows = []
+        self.count = 0 # finished transmissions
+
+    def step(self, scheme, i):
+        if (i+1) % self.every == 0:
+            row = {'transmission': self.count, 'use': i+1, 'peak': float(scheme.peak)}
+            row.update(self.laps)
+            if self.tree:
+                row['nodes'], row['depth'] = scheme.tree.size(), scheme.tree.depth()
+            if self.mass:
+                row['mass'] = float(message_mass(scheme))
+            self.rows.append(row)
+        super().step(scheme, i)
+
+    def end(self, scheme, use):
+        self.count += 1
+
+    def table(self):
+        """ Rows as a dict of arrays, nan where a row has no value """
+        columns = []
+        for row in self.rows:
+            columns.extend(c for c in row if c not in columns)
+        return {c: np.array([row.get(c, np.nan) for row in self.rows]) for c in columns}
+
+    def totals(self):
+        """ Total seconds of each phase """
+        total = {}
+        for row in self.rows:
+            for c, v in row.items():
+                if c not in ('transmission', 'use', 'peak', 'nodes', 'depth', 'mass'):
+                    total[c] = total.get(c, 0) + v
+        return total
+
+    def write(self, fn):
+        """ Append the rows to a JSON lines file """
+        with open(fn, 'a') as f:
+            for row in self.rows:
+                f.write(json.dumps(row) + '\n')
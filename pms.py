@@ -2,91 +2,209 @@
     Normal Posterior Matching Scheme
 '''
 
+import bisect
+from contextlib import ExitStack
 import numpy as np
-import bigfloat as bf
-from tree import SplayTree
+from tree import SplayTree, AVLTree
+from interval import IntervalArray
+from dyadic import DyadicIntervals
+from numeric import get_backend
+from channel import BSC
+from progress import logger
+
+log = logger('pms')
+
+# structures maintaining the probability
+STRUCTURES = {'splay': SplayTree, 'avl': AVLTree, 'array': IntervalArray, 'dyadic': DyadicIntervals}
 
 class PMS():
-    def __init__(self, crossover_prob, err_prob):
+    def __init__(self, crossover_prob, err_prob, backend=None, structure='splay', rng=None, compact_every=None, compact_threshold=0, observer=None):
         # channel settings
         self.XoverP = crossover_prob # crossover probability
         self.errP = err_prob # error probability
         self.seq = None
+        self.seq_len = None
+        self.packed = False # messages given as ints
+        self.cell = None # decoded message order, its boundaries and their PMF
+
+        # random generator: Generator, SeedSequence or seed. None draws a seed
+        # from the global numpy state, so np.random.seed still reproduces runs
+        if rng is None:
+            rng = np.random.randint(2**31 - 1)
+        self.rng = np.random.default_rng(rng)
+        self.channel = BSC(crossover_prob, self.rng)
+
+        # numeric backend: 'float64', 'bigfloat', 'mpmath', 'fraction', 'log'
+        # or 'adaptive'. The array structure only works on float64, it can't
+        # be promoted, and the exact dyadic one on fractions
+        if backend is None:
+            backend = {'array': 'float64', 'dyadic': 'fraction'}.get(structure, 'bigfloat')
+        self.num = get_backend(backend)
+        if structure == 'array' and (self.num.name != 'float64' or self.num.adaptive):
+            raise ValueError("The array structure requires the non-adaptive float64 backend")
+        if structure == 'dyadic' and self.num.name != 'fraction':
+            raise ValueError("The dyadic structure requires the fraction backend")
+
+        # probability tree settings: 'splay', 'avl', 'array' or 'dyadic'
+        if structure not in STRUCTURES:
+            raise ValueError("Unknown structure: {}".format(structure))
+        self.tree = STRUCTURES[structure].unit(self.num)
+        self.peak = self.num.value(0.5)
+
+        # compaction of the tree every compact_every channel uses, see compact
+        self.compact_every = compact_every
+        self.compact_threshold = compact_threshold
 
-        # probability tree settings
-        self.tree = SplayTree(bf.BigFloat(0), bf.BigFloat(1), bf.BigFloat(1))
-        left_node = SplayTree(bf.BigFloat(0), bf.BigFloat(0.5), bf.BigFloat(0.5))
-        self.tree.insert(left_node)
-        self.peak = bf.BigFloat(0.5)
+        # observer of the transmissions, see observer.py
+        self.observer = observer
         
-    # encode binary sequence to real number
-    def bin_to_real(self, seq):
+    # encode binary sequence to real number, seq is a '0'/'1' string or an
+    # int holding length bits
+    def bin_to_real(self, seq, length=None):
         self.seq = seq
-        dec = int(seq, 2)
-        lb = bf.div(dec, 2**(len(seq)))
-        ub = bf.div(dec+1, 2**(len(seq)))
-        return (lb+ub)/2
+        self.packed = not isinstance(seq, str)
+        if self.packed:
+            if length is None:
+                raise ValueError("Length is required for int messages")
+            dec = int(seq)
+        else:
+            length, dec = len(seq), int(seq, 2)
+        self.seq_len = length
+        # middle point of [dec/2^l, (dec+1)/2^l]
+        return self.num.value(2*dec + 1) / 2**(length+1)
+
+    # next n uniform numbers of the channel noise stream
+    def uniform(self, n=1):
+        return self.channel.uniform(n)
+
+    # switch an adaptive backend to higher precision
+    def promote(self):
+        num = self.num.promote()
+        self.precision.enter_context(num.context())
+        self.num = num
+        self.tree.convert(num)
+        self.peak = num.value(self.peak)
+        self.msg_point = self.bin_to_real(self.seq, self.seq_len)
+        self.cell = None
+
+    # promote before intervals of the given width at x can't be resolved
+    def check_precision(self, x, width):
+        if self.num.exhausted(x, width):
+            self.promote()
     
-    # decode real number to binary sequence
-    def real_to_bin(self, num, length):
+    # decode real number to the order of its length bits interval
+    def real_to_order(self, num, length):
         l = length
         decimal = int(round(num * 2**l,2)) # 0.49999 => 0.5, 0.48999 => 0.49
         if decimal >= 2**l: # TODO potential error in MPMS
             decimal = 2**l - 1
-        return format(decimal, str(l)+'b').replace(' ','0'), decimal
+        return decimal
+
+    # decode real number to binary sequence
+    def real_to_bin(self, num, length):
+        decimal = self.real_to_order(num, length)
+        return format(decimal, '0{}b'.format(length)), decimal
+
+    # decoded message in the representation of the transmitted one
+    def decoded(self, num):
+        order = self.real_to_order(num, self.seq_len)
+        return order if self.packed else format(order, '0{}b'.format(self.seq_len))
     
+    # rescale the tree, and the PMF at the boundaries of the decoded message
+    # interval with it: rescaling maps the PMF between consecutive cuts
+    # affinely, given the old PMF at the cuts. Stores which don't return it
+    # drop the PMF
+    def rescale(self, cuts, masses):
+        cdf = self.tree.rescale(cuts, masses)
+        if cdf is None:
+            self.cell = None
+        if self.cell is None:
+            return
+        order, bounds, pmf = self.cell
+        new = []
+        for x, p in zip(bounds, pmf):
+            r = bisect.bisect_right(cuts, x) # region of x
+            lo = cdf[r-1] if r > 0 else 0
+            hi = cdf[r] if r < len(cuts) else 1
+            base = sum(masses[:r])
+            new.append(base + (p - lo) * (masses[r] / (hi - lo)) if hi > lo else base)
+        self.cell = order, bounds, new
+
+    # merge the tree inside message intervals, where it can't change the
+    # mass of any message, and where its mass is below compact_threshold
+    def compact(self, i):
+        if self.compact_every and (i+1) % self.compact_every == 0:
+            self.tree.compact(self.seq_len, self.compact_threshold, keep=(self.peak,))
+            self.cell = None
+
     # check transmission terminal
-    def check_ending(self, node):
-        v = node.start_value
+    def check_ending(self):
+        v = self.peak
         # boundaries of decoded real number 
-        bin_seq, order = self.real_to_bin(v, len(self.seq))
-        # bounaries of pmf
-        l = len(bin_seq)
-        interval_lower_bound = bf.BigFloat(order) / 2**l
-        interval_upper_bound = bf.BigFloat(order+1) / 2**l
-        
-        p1 = self.tree.PMF(interval_lower_bound)
-        p2 = self.tree.PMF(interval_upper_bound)
-        return True if p2 - p1 > bf.sub(1, self.errP) else False
-
-    # standard PMS transmission
-    def transmit(self, seq, max_channel_use=None): 
-        self.msg_point = self.bin_to_real(seq)
-        # print("Message: {}, Px: {}".format(self.msg_point, self.XoverP))
+        l = self.seq_len
+        order = self.real_to_order(v, l)
+        # bounaries of pmf, only computed when the decoded message changes
+        if self.cell is None or self.cell[0] != order:
+            interval_lower_bound = self.num.value(order) / 2**l
+            interval_upper_bound = self.num.value(order+1) / 2**l
+            bounds = (interval_lower_bound, interval_upper_bound)
+            self.cell = order, bounds, self.tree.PMF_pair(*bounds)
+        p1, p2 = self.cell[2]
+        return True if p2 - p1 > 1 - self.errP else False
+
+    # standard PMS transmission, int messages need seq_len and are decoded
+    # to ints
+    def transmit(self, seq, max_channel_use=None, seq_len=None): 
+        self.cell = None
         
         max_default_use = 500
         MCU = max_channel_use if max_channel_use is not None else max_default_use
-        for i in range(MCU):
-            # np.random.seed(i) # debug mode
-            # encoding message
-            self.X = 1 if self.msg_point > self.peak else 0
-            # decoding message
-            self.Y = 1 - self.X if np.random.rand() < self.XoverP else self.X
-
-            # update probability
-            if self.Y == 0:
-                self.tree.left.p, self.tree.right.p = 1 - self.XoverP, self.XoverP
-            else:
-                self.tree.left.p, self.tree.right.p = self.XoverP, 1 - self.XoverP
-
-            # find the new middle point
-            middle_node = self.tree.quantile(0.5)
-            self.peak = middle_node.start_value
-            # print("middle: {} {}".format(self.peak, self.tree.PMF(self.peak))) # debug mode
-
-            self.tree = middle_node.parent.rotate()
-
-            # self.tree.visualize()
+        obs = self.observer
+        lap = obs.lap if obs is not None else None
+        with ExitStack() as self.precision:
+            self.precision.enter_context(self.num.context())
+            # the message point needs the precision of the backend
+            self.msg_point = self.bin_to_real(seq, seq_len)
+            # print("Message: {}, Px: {}".format(self.msg_point, self.XoverP))
+            if obs is not None:
+                obs.start(self)
+            for i in range(MCU):
+                # encoding message
+                self.X = 1 if self.msg_point > self.peak else 0
+                # decoding message
+                self.Y = self.channel.send(self.X)
+                if lap: lap('channel')
 
-            # check ending conditions
-            if self.check_ending(middle_node):
-                # self.tree.visualize() #not useful when intervals are too tiny
-                bin_seq, _ = self.real_to_bin(middle_node.start_value, len(self.seq))
-                return bin_seq, middle_node.start_value, i+1
+                # update probability on both sides of the peak
+                p = self.num.prob(self.XoverP)
+                masses = [1 - p, p] if self.Y == 0 else [p, 1 - p]
+                self.rescale([self.peak], masses)
+                if lap: lap('rescale')
 
-        bin_seq, _ = self.real_to_bin(self.peak, len(self.seq))
-        print("You have reached the maximum expected channel uses!")
-        return bin_seq, self.peak, MCU
+                # find the new middle point
+                self.tree, self.peak, width = self.tree.split(0.5, lap)
+                self.check_precision(self.peak, width)
+                # print("middle: {} {}".format(self.peak, self.tree.PMF(self.peak))) # debug mode
 
+                # self.tree.visualize()
 
+                # check ending conditions
+                ended = self.check_ending()
+                if lap: lap('check_ending')
+                if not ended:
+                    self.compact(i)
+                    if lap: lap('compact')
+                if obs is not None:
+                    obs.step(self, i)
+                if ended:
+                    # self.tree.visualize() #not useful when intervals are too tiny
+                    if obs is not None:
+                        obs.end(self, i+1)
+                    bin_seq = self.decoded(self.peak)
+                    return bin_seq, self.peak, i+1
 
+            if obs is not None:
+                obs.end(self, MCU)
+            bin_seq = self.decoded(self.peak)
+            log.warning("You have reached the maximum expected channel uses!")
+            return bin_seq, self.peak, MCU
@@ -0,0 +1,92 @@
+'''
+Logging and progress reports
+
+Modules log to children of the 'pms' logger, e.g. logger('sweep'), which
+has a NullHandler: library use is silent unless a script calls configure(),
+which prints the records of a level and above to stderr.
+
+Progress reports a sweep at most once every interval seconds, with the
+number of finished items, the rate, the ETA and the throughput of each
+message length since the last report. The numbers are also attached to the
+record (done, total, rate, eta), for handlers that collect them.
+'''
+
+import math
+import time
+import logging
+
+ROOT = 'pms'
+logging.getLogger(ROOT).addHandler(logging.NullHandler())
+
+# seconds between two progress reports
+REPORT_SECONDS = 5
+
+def logger(name=None):
+    """ Logger of a module, child of the 'pms' logger """
+    return logging.getLogger(ROOT if name is None else '{}.{}'.format(ROOT, name))
+
+def configure(level=logging.INFO, stream=None, fmt='%(asctime)s %(name)s %(levelname)s: %(message)s'):
+    """ Print the records of level ('debug', 'info', ... or a number) and above """
+    if isinstance(level, str):
+        level = level.upper()
+    root = logging.getLogger(ROOT)
+    for handler in [h for h in root.handlers if isinstance(h, logging.StreamHandler)]:
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(fmt))
+    root.addHandler(handler)
+    root.setLevel(level)
+    return root
+
+def duration(seconds):
+    """ Seconds as h:mm:ss """
+    if not math.isfinite(seconds):
+        return '?'
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return '{}:{:02d}:{:02d}'.format(h, m, s)
+
+class Progress():
+    def __init__(self, total=None, name='progress', interval=REPORT_SECONDS, log=None, level=logging.INFO):
+        self.total = total # number of items, unknown if None
+        self.name = name
+        self.interval = interval
+        self.log = log if log is not None else logger('progress')
+        self.level = level
+        self.clock = time.monotonic
+        self.done = 0
+        self.reported = 0 # items done at the last report
+        self.start = self.last = self.clock()
+        self.lengths = {} # items of each message length since the last report
+
+    def update(self, n=1, length=None):
+        """ Count n finished items of a message length, report if it is time """
+        self.done += n
+        if length is not None:
+            self.lengths[length] = self.lengths.get(length, 0) + n
+        now = self.clock()
+        if now - self.last >= self.interval or self.done == self.total:
+            self.report(now)
+
+    def report(self, now=None):
+        now = now if now is not None else self.clock()
+        if self.log.isEnabledFor(self.level):
+            elapsed, since = now - self.start, now - self.last
+            rate = self.done / elapsed if elapsed > 0 else math.nan
+            if self.total:
+                eta = (self.total - self.done) / rate if rate > 0 else math.inf
+                count = '{}/{} ({:.2f}%)'.format(self.done, self.total, 100 * self.done / self.total)
+            else:
+                eta, count = math.nan, str(self.done)
+            lengths = ', '.join('L={} {:.1f}/s'.format(L, c / since) for L, c in sorted(self.lengths.items())) if since > 0 else ''
+            extra = {'done': self.done, 'total': self.total, 'rate': rate, 'eta': eta}
+            self.log.log(self.level, "%s: %s, %.1f/s, elapsed %s, ETA %s%s", self.name, count, rate,
+                duration(elapsed), duration(eta), ' | ' + lengths if lengths else '', extra=extra)
+        self.last = now
+        self.reported = self.done
+        self.lengths = {}
+
+    def close(self):
+        """ Report the items finished since the last report """
+        if self.done != self.reported:
+            self.report()
@@ -0,0 +1,149 @@
+'''
+Per-transmission result store
+
+A store is a directory of NPZ chunks, each holding one array per column
+for a run of transmissions. Rows are buffered and written as a new chunk
+every CHUNK_ROWS rows or CHECKPOINT_SECONDS seconds, so an interrupted sweep
+keeps its results up to the last chunk and can be resumed from them, and
+every statistic can be computed later from the rows. Chunks are written to
+a temporary file first, so a crash never leaves a partial chunk.
+Transmissions that failed with an exception are not rows, they are kept
+in failures.jsonl of the store with their error, so a resumed sweep tries
+them again.
+
+Columns:
+ scheme:  'pms' or 'mpms'
+ Px, Pe:  crossover and error probability
+ n, k:    hamming block and message length, 1 and 1 for PMS
+ length:  message length
+ sample:  index of the message
+ uses:    channel uses
+ correct: whether the message was decoded correctly
+ seed:    sweep seed, -1 if the run was not seeded
+'''
+
+import os
+import glob
+import json
+import time
+import numpy as np
+
+COLUMNS = {
+    'scheme': 'U4', 'Px': np.float64, 'Pe': np.float64, 'n': np.int64, 'k': np.int64,
+    'length': np.int64, 'sample': np.int64, 'uses': np.int64, 'correct': bool, 'seed': np.int64,
+}
+
+# rows per chunk file, and longest time rows are kept in memory
+CHUNK_ROWS = 4096
+CHECKPOINT_SECONDS = 60
+
+FAILURES = 'failures.jsonl'
+
+class ResultStore():
+    def __init__(self, path, chunk_rows=CHUNK_ROWS, checkpoint=CHECKPOINT_SECONDS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.checkpoint = checkpoint
+        self.rows = []
+        self.last_flush = time.monotonic()
+        os.makedirs(path, exist_ok=True)
+
+    def chunks(self):
+        return sorted(glob.glob(os.path.join(self.path, 'chunk_*.npz')))
+
+    def append(self, **row):
+        """ Buffer one transmission, write a chunk when the buffer is full """
+        self.rows.append(tuple(row[c] for c in COLUMNS))
+        if len(self.rows) >= self.chunk_rows or time.monotonic() - self.last_flush >= self.checkpoint:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows as a new chunk """
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        table = np.array(self.rows, dtype=list(COLUMNS.items()))
+        fn = os.path.join(self.path, 'chunk_{:06d}.npz'.format(len(self.chunks())))
+        with open(fn + '.tmp', 'wb') as f:
+            np.savez(f, **{c: table[c] for c in COLUMNS})
+        os.replace(fn + '.tmp', fn)
+        self.rows = []
+
+    def clear(self):
+        """ Remove every row and failure of the store """
+        for fn in self.chunks():
+            os.remove(fn)
+        if os.path.exists(os.path.join(self.path, FAILURES)):
+            os.remove(os.path.join(self.path, FAILURES))
+        self.rows = []
+
+    def fail(self, **info):
+        """ Record a failed transmission, e.g. its length, sample, seed and error """
+        with open(os.path.join(self.path, FAILURES), 'a') as f:
+            f.write(json.dumps(info) + '\n')
+
+    def failures(self, **filters):
+        """ Failed transmissions matching filters, as dicts """
+        fn = os.path.join(self.path, FAILURES)
+        if not os.path.exists(fn):
+            return []
+        with open(fn, 'r') as f:
+            failed = [json.loads(line) for line in f if line.strip()]
+        return [r for r in failed if all(r.get(c) == v for c, v in filters.items())]
+
+    def load(self, **filters):
+        """ Columns of all written rows matching filters, e.g. scheme='pms' """
+        parts = []
+        for fn in self.chunks():
+            with np.load(fn) as f:
+                parts.append({c: f[c] for c in COLUMNS})
+        table = {c: np.concatenate([p[c] for p in parts]) if parts else np.empty(0, dtype=t)
+            for c, t in COLUMNS.items()}
+        keep = np.ones(len(table['length']), dtype=bool)
+        for c, v in filters.items():
+            keep &= table[c] == v
+        return {c: a[keep] for c, a in table.items()}
+
+    def completed(self, **filters):
+        """ (uses, correct, n) of each (length, sample) already recorded """
+        t = self.load(**filters)
+        return {(int(L), int(i)): (int(u), bool(c), int(n))
+            for L, i, u, c, n in zip(t['length'], t['sample'], t['uses'], t['correct'], t['n'])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+def rates(table):
+    """ Transmission rate of each row, 0 if wrong """
+    rate = table['length'] / (table['uses'] * table['n'])
+    return np.where(table['correct'], rate, 0)
+
+def mean_curve(table, stat='rate', max_len=None):
+    """ Mean rate or uses over the correct rows of each message length
+
+    Entry L-1 holds length L, like the old log files. Lengths without a
+    correct row are nan.
+    """
+    L = table['length']
+    max_len = max_len if max_len is not None else (L.max() if len(L) else 0)
+    ok = table['correct'] & (L <= max_len)
+    x = rates(table) if stat == 'rate' else table['uses']
+    total = np.bincount(L[ok] - 1, weights=x[ok], minlength=max_len)
+    count = np.bincount(L[ok] - 1, minlength=max_len)
+    return total / np.where(count > 0, count, np.nan)
+
+def read_curve(fn):
+    """ Curve of an old log file, e.g. 'log/pms_len_tranx_rate_Px=0.1.txt'
+
+    Read from the store named without the statistic ('log/pms_len_Px=0.1')
+    if there is one, else from the text file.
+    """
+    folder, name = os.path.split(os.path.splitext(fn)[0])
+    stat = 'rate' if '_tranx_rate' in name else 'uses'
+    path = os.path.join(folder, name.replace('_tranx_rate', '').replace('_channel_use', ''))
+    if os.path.isdir(path):
+        return mean_curve(ResultStore(path).load(), stat).astype(np.float32)
+    return np.loadtxt(fn, dtype=np.float32, ndmin=1)
@@ -0,0 +1,207 @@
+'''
+Parallel sweeps of message length against transmission rate
+
+Every (message length, sample) pair is an independent work item transmitted
+in a worker process with its own random stream, spawned from the sweep seed,
+so a sweep gives the same result whatever the number of processes or the
+completion order, and with the array structure the same as BatchPMS given
+the same task seeds.
+Averages are computed the same way as the serial test functions: over the
+correctly transmitted samples only. Every transmission can be recorded in a
+ResultStore as it completes, and a sweep interrupted after that can be
+resumed from the store. A transmission raising an exception does not stop
+the sweep: it is logged, recorded as a failure with its length, sample and
+seed, and left out of the averages. adaptive_sweep() draws samples of each length only
+until the confidence intervals of its rate and error rate are narrow enough.
+'''
+
+import os
+from multiprocessing import Pool
+import numpy as np
+from pms import PMS
+from mpms import MPMS
+from scipy.stats import norm
+from utility import load_msg, msg_to_int, msg_file, read_msg
+from messages import MessageSource
+from progress import logger, Progress
+
+log = logger('sweep')
+
+# messages are read from the source in chunks of this size
+MSG_CHUNK = 256
+
+def task_seed(seed, L, i):
+    """ Seed sequence of sample i of length L, independent of the others """
+    return np.random.SeedSequence(seed, spawn_key=(L, i))
+
+def run_task(task):
+    """ Transmit one message, return (L, i, use, correct, hamming block length, error)
+
+    error is None, or the exception raised by the transmission as a string,
+    then use and block length are 0.
+    """
+    scheme, L, i, msg, Px, Pe, hmsg_len, seed, backend, structure = task
+    try:
+        if scheme == 'pms':
+            s, v, u = PMS(Px, Pe, backend, structure, rng=seed).transmit(msg, max_channel_use=500, seq_len=L)
+            hblk_len = 1
+        else:
+            s, u, hblk_len = MPMS(Px, Pe, backend, structure, rng=seed).transmit(msg, max_channel_use=500, err_num=None, msg_len=hmsg_len, seq_len=L)
+    except Exception as e:
+        return L, i, 0, False, 0, '{}: {}'.format(type(e).__name__, e)
+    return L, i, u, s == msg, hblk_len, None
+
+def record_failure(store, failures, **info):
+    """ Log a failed transmission, record it in store and the failures list """
+    log.error("Transmission failed: %s", ', '.join('{}={}'.format(k, v) for k, v in info.items()))
+    if store is not None:
+        store.fail(**info)
+    if failures is not None:
+        failures.append(info)
+
+def mean_nonzero(x):
+    """ Row means over the non-zero (correct) samples """
+    count = np.count_nonzero(x, axis=1)
+    return x.sum(axis=1) / np.where(count > 0, count, np.nan)
+
+def messages(L, sample_size, source_seed=None, start=0):
+    """ Iterate over messages start to sample_size of length L as ints
+
+    Messages come from the corpus, the binary one or else the text one, or
+    from MessageSource(L, source_seed) in chunks if source_seed is given, so
+    no file is needed.
+    """
+    if source_seed is None and not os.path.exists(msg_file(L)): # text corpus
+        yield from read_msg(L, packed=True)[start:sample_size]
+    elif source_seed is None:
+        msg = load_msg(L)
+        for i in range(start, sample_size):
+            yield msg_to_int(msg[i], L)
+    else:
+        for chunk in MessageSource(L, source_seed).chunks(MSG_CHUNK, start, sample_size):
+            yield from chunk
+
+def sweep(scheme, Px, Pe, lengths, sample_size, hmsg_len=4, processes=None, seed=0, source_seed=None, store=None, resume=False,
+        failures=None, backend=None, structure='splay'):
+    """ Average transmission rate and channel use for each message length
+
+    scheme:      'pms' or 'mpms'
+    lengths:     message lengths, e.g. range(1, 41)
+    hmsg_len:    hamming message length, only used by 'mpms'
+    processes:   number of worker processes, all cores by default
+    source_seed: generate messages with this seed instead of reading them
+    store:       ResultStore recording every transmission
+    resume:      skip the transmissions already recorded in store
+    failures:    list to which the failed transmissions are appended
+    backend:     numeric backend of the schemes, their default if None
+    structure:   posterior structure of the schemes
+    """
+    lengths = list(lengths)
+    row = {L: k for k, L in enumerate(lengths)}
+    rate = np.zeros((len(lengths), sample_size))
+    use = np.zeros((len(lengths), sample_size))
+
+    # results of an interrupted sweep
+    k = hmsg_len if scheme == 'mpms' else 1
+    done = store.completed(scheme=scheme, Px=Px, Pe=Pe, k=k, seed=seed) if resume else {}
+    for (L, i), (u, correct, hblk_len) in done.items():
+        if correct and L in row and i < sample_size:
+            rate[row[L], i], use[row[L], i] = L / u / hblk_len, u
+
+    tasks = ((scheme, L, i, m, Px, Pe, hmsg_len, task_seed(seed, L, i), backend, structure)
+        for L in lengths for i, m in enumerate(messages(L, sample_size, source_seed))
+        if (L, i) not in done)
+    total = len(lengths) * sample_size - sum(1 for L, i in done if L in row and i < sample_size)
+    processes = processes if processes is not None else os.cpu_count()
+    chunksize = max(1, total // (16 * processes))
+    progress = Progress(total, '{} sweep'.format(scheme))
+    with Pool(processes) as pool:
+        for L, i, u, correct, hblk_len, error in pool.imap_unordered(run_task, tasks, chunksize):
+            progress.update(length=L)
+            if error is not None:
+                record_failure(store, failures, scheme=scheme, Px=Px, Pe=Pe, k=k, length=L, sample=i, seed=seed, error=error)
+                continue
+            if correct:
+                rate[row[L], i], use[row[L], i] = L / u / hblk_len, u
+            if store is not None:
+                store.append(scheme=scheme, Px=Px, Pe=Pe, n=hblk_len, k=k, length=L, sample=i, uses=u, correct=correct, seed=seed)
+    progress.close()
+
+    return mean_nonzero(rate), mean_nonzero(use)
+
+def rate_interval(rate, correct, z):
+    """ Mean rate of the correct samples and half width of its interval """
+    r = rate[correct]
+    if len(r) < 2:
+        return np.nan, np.inf
+    return r.mean(), z * r.std(ddof=1) / np.sqrt(len(r))
+
+def error_interval(correct, z):
+    """ Error rate and half width of its Wilson score interval """
+    n = len(correct)
+    if n == 0:
+        return np.nan, np.inf
+    p = 1 - correct.mean()
+    w = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return p, w
+
+def adaptive_sweep(scheme, Px, Pe, lengths, tol, err_tol=None, confidence=0.95, min_samples=30,
+        max_samples=1000, hmsg_len=4, processes=None, seed=0, source_seed=None, store=None, failures=None,
+        backend=None, structure='splay'):
+    """ Sample each message length until its confidence intervals are narrow
+
+    Transmissions of a length run in rounds, growing by half of the samples
+    so far, until the half width of the interval of the mean rate is below
+    tol and that of the error rate below err_tol (tol by default), or
+    max_samples is reached. Sample i is the same transmission as in sweep(),
+    so the first samples of both agree. Failed transmissions are left out of
+    the intervals, like in sweep(), and backend and structure are passed to
+    the schemes. Return a dict of arrays over lengths: rate, rate_hw, use,
+    err, err_hw and samples.
+    """
+    lengths = list(lengths)
+    err_tol = err_tol if err_tol is not None else tol
+    z = norm.ppf((1 + confidence) / 2)
+    rate = {L: np.zeros(max_samples) for L in lengths}
+    use = {L: np.zeros(max_samples) for L in lengths}
+    correct = {L: np.zeros(max_samples, dtype=bool) for L in lengths}
+    failed = {L: np.zeros(max_samples, dtype=bool) for L in lengths}
+    count = {L: 0 for L in lengths}
+    result = {k: np.zeros(len(lengths)) for k in ('rate', 'rate_hw', 'use', 'err', 'err_hw', 'samples')}
+
+    k = hmsg_len if scheme == 'mpms' else 1
+    active = list(lengths)
+    processes = processes if processes is not None else os.cpu_count()
+    progress = Progress(None, '{} adaptive sweep'.format(scheme))
+    with Pool(processes) as pool:
+        while active:
+            # next round of every unfinished length
+            stop = {L: min(max_samples, max(min_samples, count[L] + count[L] // 2)) for L in active}
+            tasks = [(scheme, L, i, m, Px, Pe, hmsg_len, task_seed(seed, L, i), backend, structure)
+                for L in active for i, m in enumerate(messages(L, stop[L], source_seed, count[L]), count[L])]
+            chunksize = max(1, len(tasks) // (16 * processes))
+            for L, i, u, ok, hblk_len, error in pool.imap_unordered(run_task, tasks, chunksize):
+                progress.update(length=L)
+                if error is not None:
+                    failed[L][i] = True
+                    record_failure(store, failures, scheme=scheme, Px=Px, Pe=Pe, k=k, length=L, sample=i, seed=seed, error=error)
+                    continue
+                rate[L][i], use[L][i], correct[L][i] = L / u / hblk_len, u, ok
+                if store is not None:
+                    store.append(scheme=scheme, Px=Px, Pe=Pe, n=hblk_len, k=k, length=L, sample=i, uses=u, correct=ok, seed=seed)
+
+            for L in list(active):
+                count[L] = n = stop[L]
+                valid = ~failed[L][:n]
+                r, r_hw = rate_interval(rate[L][:n][valid], correct[L][:n][valid], z)
+                e, e_hw = error_interval(correct[L][:n][valid], z)
+                u = use[L][:n][correct[L][:n]].mean() if correct[L][:n].any() else np.nan
+                j = lengths.index(L)
+                for key, v in zip(result, (r, r_hw, u, e, e_hw, n)):
+                    result[key][j] = v
+                if (r_hw <= tol and e_hw <= err_tol) or n >= max_samples:
+                    active.remove(L)
+            log.info("Adaptive sweep: %d lengths left, %d samples", len(active), sum(count.values()))
+    progress.close()
+
+    return result
@@ -2,7 +2,8 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 from hamming import HammingCode
-from utility import h, BSC_capacity, BSC_Hamming_capacity, hamming_err_prob, hamming_LOEP
+from capacity import h, BSC_capacity, BSC_Hamming_capacity, hamming_err_prob, hamming_LOEP, capacity_grid
+from results import read_curve
 
 Px = 0.2
 Pe = 0.01
@@ -30,13 +31,8 @@ def test_cmp_code_len_against_tranx_rate(Px, Pe, msgL=4, est=False):
     fn_pms = os.path.join('log', fn_pms)
     fn_HEP = os.path.join('log', fn_HEP)
     
-    with open(fn_pms, 'r') as f:
-        rate_list_pms = f.readlines()
-        rate_pms = np.array([np.float32(r.strip()) for r in rate_list_pms])
-    
-    with open(fn_HEP, 'r') as f:
-        rate_list_HEP = f.readlines()
-        rate_HEP = np.array([np.float32(r.strip()) for r in rate_list_HEP])
+    rate_pms = read_curve(fn_pms)
+    rate_HEP = read_curve(fn_HEP)
     
     if est: # estimate scaled probability
         fn_Px = 'mpms_len_tranx_rate_({},{})_Ps=Px.txt'.format(hblk_len,hmsg_len)
@@ -44,13 +40,8 @@ def test_cmp_code_len_against_tranx_rate(Px, Pe, msgL=4, est=False):
         fn_Px = os.path.join('log', fn_Px)
         fn_LOEP = os.path.join('log', fn_LOEP)
         
-        with open(fn_Px, 'r') as f:
-            rate_list_Px = f.readlines()
-            rate_Px = np.array([np.float32(r.strip()) for r in rate_list_Px])
-        
-        with open(fn_LOEP, 'r') as f:
-            rate_list_LOEP = f.readlines()
-            rate_LOEP = np.array([np.float32(r.strip()) for r in rate_list_LOEP])
+        rate_Px = read_curve(fn_Px)
+        rate_LOEP = read_curve(fn_LOEP)
 
     # capacity
     capacity = BSC_capacity(Px)
@@ -115,40 +106,17 @@ def test_cmp_hamming_7_4_diff_Px(Pe):
     fn_HEP_2 = os.path.join('log', fn_HEP_2)
     fn_HEP_3 = os.path.join('log', fn_HEP_3)
     
-    with open(fn_pms_1, 'r') as f:
-        rate_list_pms_1 = f.readlines()
-        rate_pms_1 = np.array([np.float32(r.strip()) for r in rate_list_pms_1])
-    
-    with open(fn_pms_2, 'r') as f:
-        rate_list_pms_2 = f.readlines()
-        rate_pms_2 = np.array([np.float32(r.strip()) for r in rate_list_pms_2])
-
-    with open(fn_pms_3, 'r') as f:
-        rate_list_pms_3 = f.readlines()
-        rate_pms_3 = np.array([np.float32(r.strip()) for r in rate_list_pms_3])
-    
-    with open(fn_HEP_1, 'r') as f:
-        rate_list_HEP_1 = f.readlines()
-        rate_HEP_1 = np.array([np.float32(r.strip()) for r in rate_list_HEP_1])
-
-    with open(fn_HEP_2, 'r') as f:
-        rate_list_HEP_2 = f.readlines()
-        rate_HEP_2 = np.array([np.float32(r.strip()) for r in rate_list_HEP_2])
-
-    with open(fn_HEP_3, 'r') as f:
-        rate_list_HEP_3 = f.readlines()
-        rate_HEP_3 = np.array([np.float32(r.strip()) for r in rate_list_HEP_3])
+    rate_pms_1 = read_curve(fn_pms_1)
+    rate_pms_2 = read_curve(fn_pms_2)
+    rate_pms_3 = read_curve(fn_pms_3)
+    rate_HEP_1 = read_curve(fn_HEP_1)
+    rate_HEP_2 = read_curve(fn_HEP_2)
+    rate_HEP_3 = read_curve(fn_HEP_3)
 
     # capacity
-    capacity_1 = BSC_capacity(0.1)
-    capacity_2 = BSC_capacity(0.2)
-    capacity_3 = BSC_capacity(0.3)
-    rho1 = hamming_err_prob(0.1, 4, 7)
-    rho2 = hamming_err_prob(0.2, 4, 7)
-    rho3 = hamming_err_prob(0.3, 4, 7)
-    capacity_with_HEP_1 = BSC_Hamming_capacity(7, 4, rho1)
-    capacity_with_HEP_2 = BSC_Hamming_capacity(7, 4, rho2)
-    capacity_with_HEP_3 = BSC_Hamming_capacity(7, 4, rho3)
+    grid = capacity_grid([0.1, 0.2, 0.3], [4])
+    capacity_1, capacity_2, capacity_3 = grid['bsc'][:, 0]
+    capacity_with_HEP_1, capacity_with_HEP_2, capacity_with_HEP_3 = grid['hamming'][:, 0]
 
     # data to be plotted
     x = np.array(range(min_msg_len, max_msg_len+1))
@@ -221,17 +189,9 @@ def test_mismatched_Px(Px, Pe, msgL=4):
     fn_HEP = os.path.join('log', fn_HEP)
     fn_mm = os.path.join('log', fn_mm)
     
-    with open(fn_pms, 'r') as f:
-        rate_list_pms = f.readlines()
-        rate_pms = np.array([np.float32(r.strip()) for r in rate_list_pms])
-    
-    with open(fn_HEP, 'r') as f:
-        rate_list_HEP = f.readlines()
-        rate_HEP = np.array([np.float32(r.strip()) for r in rate_list_HEP])
-
-    with open(fn_mm, 'r') as f:
-        rate_list_mm = f.readlines()
-        rate_mm = np.array([np.float32(r.strip()) for r in rate_list_mm])
+    rate_pms = read_curve(fn_pms)
+    rate_HEP = read_curve(fn_HEP)
+    rate_mm = read_curve(fn_mm)
 
     # capacity
     capacity = BSC_capacity(Px)
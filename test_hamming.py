@@ -1,6 +1,6 @@
 import numpy as np
 from hamming import HammingCode
-from utility import hamming_err_prob, BSC_Hamming_capacity
+from capacity import hamming_err_prob, BSC_Hamming_capacity, block_length
 from scipy.special import comb
 
 # msg_len = 4
@@ -27,25 +27,18 @@ from scipy.special import comb
 
 def test_diff_hamming_err_prob(msg_Lmin, msg_Lmax, Px, display=False):
     msg_len = np.arange(msg_Lmin, msg_Lmax+1)
-    blk_len = np.arange(msg_Lmin, msg_Lmax+1)
-    p = np.zeros((msg_Lmax - msg_Lmin + 1))
-    for ml in msg_len:
-        r = HammingCode.calc_redundant_bits(ml)
-        bl = ml + r
-        blk_len[ml - msg_Lmin] = bl
-        p[ml - msg_Lmin] = hamming_err_prob(Px, ml, bl)
-        if display:
-            print('hamming({},{}): {}'.format(bl,ml,p[ml-msg_Lmin]))
+    blk_len = block_length(msg_len)
+    p = hamming_err_prob(Px, msg_len, blk_len)
+    if display:
+        for ml, bl, pl in zip(msg_len, blk_len, p):
+            print('hamming({},{}): {}'.format(bl,ml,pl))
     return msg_len, blk_len, p
 
 def test_diff_capacity_with_pms(msg_Lmin, msg_Lmax, Px, display=False):
     msg_len, blk_len, prob = test_diff_hamming_err_prob(msg_Lmin, msg_Lmax, Px)
-    capcity = np.zeros(msg_Lmax - msg_Lmin + 1)
-    for i in range(len(msg_len)):
-        ml, bl, rho = msg_len[i], blk_len[i], prob[i]
-        cap = BSC_Hamming_capacity(bl, ml, rho)
-        capcity[i] = cap
-        if display:
+    capcity = BSC_Hamming_capacity(blk_len, msg_len, prob)
+    if display:
+        for ml, bl, cap in zip(msg_len, blk_len, capcity):
             print('Capacity of Hamming({},{}): {}'.format(bl,ml,cap))
     return capcity
 
@@ -2,8 +2,12 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 from mpms import MPMS
-from utility import h, BSC_capacity, read_msg, hamming_err_prob, BSC_Hamming_capacity
+from sweep import sweep, adaptive_sweep, messages, task_seed
+from utility import read_msg
+from capacity import h, BSC_capacity, hamming_err_prob, BSC_Hamming_capacity, capacity_grid
 from hamming import HammingCode
+from results import ResultStore, read_curve
+from progress import configure, Progress
 
 """
 A series test functions about modified Posterior Matching Scheme
@@ -85,11 +89,20 @@ def test_mpms_err_num_against_err_prob_with_not_errors_all_corrected(sequence, P
     plt.savefig(os.path.join("graph", "mpms_err_num_err_prob.png"))
     plt.show()
 
-def test_mpms_len_against_tranx_rate_with_not_errors_all_corrected(Px, Pe, cmt:str):
+def test_mpms_len_against_tranx_rate_with_not_errors_all_corrected(Px, Pe, cmt:str, processes=None, source_seed=None, resume=False, tol=None,
+        backend=None, structure='splay', seed=0):
     """ Plot message length against transmission rate, write log file
     
-    This function will record average transmission rate and channel use for
-    each message length. Existent log file will be overwritten. 
+    This function will record every transmission in the result store 
+    log/mpms_len_(n,k)_<cmt>, see results.py. Existent store will be 
+    overwritten, unless resume is set: then the transmissions recorded by an
+    interrupted run are skipped. With processes, samples are spread over 
+    that many worker processes. With source_seed, messages are generated by
+    a MessageSource instead of read. With tol, each length is sampled in 
+    parallel only until the confidence interval of its rate is narrower, see
+    adaptive_sweep(). backend and structure are those of every MPMS. Every
+    transmission draws its noise from task_seed(seed, length, sample), so
+    serial and parallel runs of the same seed give the same results.
     """
 
     # hamming code
@@ -102,33 +115,48 @@ def test_mpms_len_against_tranx_rate_with_not_errors_all_corrected(Px, Pe, cmt:s
     sample_size = 700
     tranx_rate = np.zeros(max_msg_len - min_msg_len + 1)
     channel_use = np.zeros(max_msg_len - min_msg_len + 1)
-    for l in range(min_msg_len, max_msg_len+1):
-        rate = np.zeros(sample_size)
-        use = np.zeros(sample_size)
-        msg = read_msg(l)
-        for i in range(sample_size):
-            mpms = MPMS(Px, Pe)
-            s, u, L = mpms.transmit(msg[i], max_channel_use=500, err_num=None, msg_len=hmsg_len)
-            if s == msg[i]:
-                rate[i] = l / u / hblk_len
-                use[i] = u
-            print("Progress: {}%".format(np.round(100*((l-min_msg_len)*sample_size+i) / (max_msg_len+1-min_msg_len) / sample_size,2)))
-        # tranx_rate.append(sum(rate)/len(rate))
-        tranx_rate[l-1] = np.mean(rate[np.nonzero(rate)])
-        channel_use[l-1] = np.mean(use[np.nonzero(use)])
-
-    # log file
-    fn_trx = "mpms_len_tranx_rate_({},{})_{}.txt".format(hblk_len, hmsg_len, cmt)
-    fn_trx = os.path.join('log', fn_trx)
-    with open(fn_trx, 'w') as f:
-        for rate in tranx_rate:
-            f.write(str(rate)+'\n')
-
-    fn_use = "mpms_len_channel_use_({},{})_{}.txt".format(hblk_len, hmsg_len, cmt)
-    fn_use = os.path.join('log', fn_use)
-    with open(fn_use, 'w') as f:
-        for use in channel_use:
-            f.write(str(use)+'\n')
+    store = ResultStore(os.path.join('log', "mpms_len_({},{})_{}".format(hblk_len, hmsg_len, cmt)))
+    if not resume:
+        store.clear()
+    if tol is not None: # adaptive sampling
+        lengths = range(min_msg_len, max_msg_len+1)
+        with store:
+            res = adaptive_sweep('mpms', Px, Pe, lengths, tol, max_samples=sample_size, hmsg_len=hmsg_len, processes=processes, seed=seed, source_seed=source_seed, store=store,
+                backend=backend, structure=structure)
+        tranx_rate, channel_use = res['rate'], res['use']
+        for l, hw, n in zip(lengths, res['rate_hw'], res['samples']):
+            print("Length {}: rate +- {:.4f}, {} samples".format(l, hw, int(n)))
+    elif processes is not None: # parallel sweep
+        lengths = range(min_msg_len, max_msg_len+1)
+        with store:
+            tranx_rate, channel_use = sweep('mpms', Px, Pe, lengths, sample_size, hmsg_len, processes, seed=seed, source_seed=source_seed, store=store, resume=resume,
+                backend=backend, structure=structure)
+    else:
+        done = store.completed(scheme='mpms', Px=Px, Pe=Pe, k=hmsg_len, seed=seed)
+        progress = Progress((max_msg_len+1-min_msg_len) * sample_size, 'mpms')
+        for l in range(min_msg_len, max_msg_len+1):
+            rate = np.zeros(sample_size)
+            use = np.zeros(sample_size)
+            if source_seed is None:
+                msg = read_msg(l)
+            else: # generated lazily
+                msg = (format(m, '0{}b'.format(l)) for m in messages(l, sample_size, source_seed))
+            for i, m in zip(range(sample_size), msg):
+                if (l, i) in done: # recorded by an interrupted run
+                    u, correct, _ = done[(l, i)]
+                else:
+                    mpms = MPMS(Px, Pe, backend, structure, rng=task_seed(seed, l, i))
+                    s, u, L = mpms.transmit(m, max_channel_use=500, err_num=None, msg_len=hmsg_len, seq_len=l)
+                    correct = s == m
+                    store.append(scheme='mpms', Px=Px, Pe=Pe, n=hblk_len, k=hmsg_len, length=l, sample=i, uses=u, correct=correct, seed=seed)
+                if correct:
+                    rate[i] = l / u / hblk_len
+                    use[i] = u
+                progress.update(length=l)
+            # tranx_rate.append(sum(rate)/len(rate))
+            tranx_rate[l-1] = np.mean(rate[np.nonzero(rate)])
+            channel_use[l-1] = np.mean(use[np.nonzero(use)])
+        store.flush()
 
     # plot
     x = np.array(range(min_msg_len, max_msg_len+1))
@@ -167,36 +195,16 @@ def test_cmp_diff_hamming(Px, Pe, cmt):
     fn_63 = os.path.join('log', fn_63)
     fn_74 = os.path.join('log', fn_74)
     fn_1410 = os.path.join('log', fn_1410) 
-    with open(fn_pms, 'r') as f:
-        rate_list_pms = f.readlines()
-        rate_pms = np.array([np.float32(r.strip()) for r in rate_list_pms])
-
-    with open(fn_52, 'r') as f:
-        rate_list_52 = f.readlines()
-        rate_52 = np.array([np.float32(r.strip()) for r in rate_list_52])
-    
-    with open(fn_63, 'r') as f:
-        rate_list_63 = f.readlines()
-        rate_63 = np.array([np.float32(r.strip()) for r in rate_list_63])
-    
-    with open(fn_74, 'r') as f:
-        rate_list_74 = f.readlines()
-        rate_74 = np.array([np.float32(r.strip()) for r in rate_list_74])
-
-    with open(fn_1410, 'r') as f:
-        rate_list_1410 = f.readlines()
-        rate_1410 = np.array([np.float32(r.strip()) for r in rate_list_1410])
+    rate_pms = read_curve(fn_pms)
+    rate_52 = read_curve(fn_52)
+    rate_63 = read_curve(fn_63)
+    rate_74 = read_curve(fn_74)
+    rate_1410 = read_curve(fn_1410)
 
     # capacity
-    rho1 = hamming_err_prob(Px, 2, 5)
-    rho2 = hamming_err_prob(Px, 3, 6)
-    rho3 = hamming_err_prob(Px, 4, 7)
-    rho4 = hamming_err_prob(Px, 10, 14)
+    grid = capacity_grid(Px, [2, 3, 4, 10])
     capacity = BSC_capacity(Px)
-    capacity_52 = BSC_Hamming_capacity(5, 2, rho1)
-    capacity_63 = BSC_Hamming_capacity(6, 3, rho2)
-    capacity_74 = BSC_Hamming_capacity(7, 4, rho3)
-    capacity_1410 = BSC_Hamming_capacity(14, 10, rho4)
+    capacity_52, capacity_63, capacity_74, capacity_1410 = grid['hamming'][0]
 
     # plot
     x = np.array(range(min_msg_len, max_msg_len+1))
@@ -233,6 +241,7 @@ def test_cmp_diff_hamming(Px, Pe, cmt):
     plt.show()
 
 if __name__ == "__main__":
+    configure('info')
     # test_mpms_once_with_errors_all_corrected(seq, Px, Pe)
     # test_mpms_once_with_errors_not_all_corrected(68, Px, Pe)
     # test_mpms_err_num_against_err_prob_with_not_errors_all_corrected(seq, Px, Pe)
@@ -2,7 +2,13 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 from pms import PMS
-from utility import h, BSC_capacity, read_msg
+from numeric import get_backend
+from batch import BatchPMS
+from sweep import sweep, adaptive_sweep, messages, task_seed
+from utility import read_msg
+from capacity import h, BSC_capacity
+from results import ResultStore
+from progress import configure, Progress
 
 """
 A series test functions about standard Posterior Matching Scheme
@@ -65,11 +71,23 @@ def test_pms_len_against_channel_use(seq, Px):
     plt.show()
 
 
-def test_pms_len_against_tranx_rate(Px, Pe, cmt):
+def test_pms_len_against_tranx_rate(Px, Pe, cmt, batch=False, processes=None, source_seed=None, resume=False, tol=None,
+        backend=None, structure='splay', seed=0):
     """ Plot message length against transmission rate, write log file
     
-    This function will record average transmission rate and channel use for
-    each message length. Existent log file will be overwritten. 
+    This function will record every transmission in the result store 
+    log/pms_len_<cmt>, see results.py. Existent store will be overwritten, 
+    unless resume is set: then the transmissions recorded by an interrupted
+    run are skipped. With batch, all samples of a length are transmitted in 
+    lockstep by BatchPMS. With processes, samples are spread over that many 
+    worker processes. With source_seed, messages are generated by a 
+    MessageSource instead of read. With tol, each length is sampled in 
+    parallel only until the confidence interval of its rate is narrower, see
+    adaptive_sweep(). backend and structure are those of every PMS, BatchPMS
+    always works on float64 arrays. Every transmission draws its noise from
+    task_seed(seed, length, sample), so serial, batch and parallel runs of
+    the same seed give the same results, batch ones those of the array
+    structure.
     """
 
     min_code_len = 1
@@ -77,35 +95,58 @@ def test_pms_len_against_tranx_rate(Px, Pe, cmt):
     sample_size = 700
     tranx_rate = np.zeros(max_code_len - min_code_len + 1)
     channel_use = np.zeros(max_code_len - min_code_len + 1)
-    for l in range(min_code_len,max_code_len+1):
-        rate = np.zeros(sample_size)
-        use = np.zeros(sample_size)
-        msg = read_msg(l)
-        for i in range(sample_size):
-            pms = PMS(Px, Pe)
-            s, v, u = pms.transmit(msg[i], max_channel_use=500)
-            if s == msg[i]:
-                rate[i] = l / u
-                use[i] = u
-            print("Progress: {}%".format(np.round(100*((l-min_code_len)*sample_size+i) / (max_code_len+1-min_code_len) / sample_size,2)))
-        # tranx_rate.append(sum(rate)/len(rate))
-        tranx_rate[l-1] = np.mean(rate[np.nonzero(rate)])
-        channel_use[l-1] = np.mean(use[np.nonzero(use)])
+    store = ResultStore(os.path.join('log', "pms_len_{}".format(cmt)))
+    if not resume:
+        store.clear()
+    if tol is not None: # adaptive sampling
+        lengths = range(min_code_len, max_code_len+1)
+        with store:
+            res = adaptive_sweep('pms', Px, Pe, lengths, tol, max_samples=sample_size, processes=processes, seed=seed, source_seed=source_seed, store=store,
+                backend=backend, structure=structure)
+        tranx_rate, channel_use = res['rate'], res['use']
+        for l, hw, n in zip(lengths, res['rate_hw'], res['samples']):
+            print("Length {}: rate +- {:.4f}, {} samples".format(l, hw, int(n)))
+    elif processes is not None: # parallel sweep
+        lengths = range(min_code_len, max_code_len+1)
+        with store:
+            tranx_rate, channel_use = sweep('pms', Px, Pe, lengths, sample_size, processes=processes, seed=seed, source_seed=source_seed, store=store, resume=resume,
+                backend=backend, structure=structure)
+    else:
+        done = store.completed(scheme='pms', Px=Px, Pe=Pe, seed=seed)
+        progress = Progress((max_code_len+1-min_code_len) * sample_size, 'pms')
+        for l in range(min_code_len,max_code_len+1):
+            rate = np.zeros(sample_size)
+            use = np.zeros(sample_size)
+            if source_seed is None:
+                msg = read_msg(l)
+            else:
+                msg = [format(m, '0{}b'.format(l)) for m in messages(l, sample_size, source_seed)]
+            todo = [i for i in range(sample_size) if (l, i) not in done]
+            if batch and todo:
+                results = BatchPMS(Px, Pe).transmit([msg[i] for i in todo], max_channel_use=500,
+                    seeds=[task_seed(seed, l, i) for i in todo])
+                results = dict(zip(todo, results))
+            for i in range(sample_size):
+                if (l, i) in done: # recorded by an interrupted run
+                    u, correct, _ = done[(l, i)]
+                else:
+                    if batch:
+                        s, v, u = results[i]
+                    else:
+                        pms = PMS(Px, Pe, backend, structure, rng=task_seed(seed, l, i))
+                        s, v, u = pms.transmit(msg[i], max_channel_use=500, seq_len=l)
+                    correct = s == msg[i]
+                    store.append(scheme='pms', Px=Px, Pe=Pe, n=1, k=1, length=l, sample=i, uses=u, correct=correct, seed=seed)
+                if correct:
+                    rate[i] = l / u
+                    use[i] = u
+                progress.update(length=l)
+            # tranx_rate.append(sum(rate)/len(rate))
+            tranx_rate[l-1] = np.mean(rate[np.nonzero(rate)])
+            channel_use[l-1] = np.mean(use[np.nonzero(use)])
+        store.flush()
     capacity = BSC_capacity(Px)
 
-    # log file
-    fn_trx = "pms_len_tranx_rate_{}.txt".format(cmt)
-    fn_trx = os.path.join('log', fn_trx)
-    with open(fn_trx, 'w') as f:
-        for rate in tranx_rate:
-            f.write(str(rate)+'\n')
-
-    fn_use = "pms_len_channel_use_{}.txt".format(cmt)
-    fn_use = os.path.join('log', fn_use)
-    with open(fn_use, 'w') as f:
-        for use in channel_use:
-            f.write(str(use)+'\n')
-
     # plot
     x = np.array(range(min_code_len, max_code_len+1))
     y = tranx_rate
@@ -152,8 +193,69 @@ def test_pms_err_prob_against_tranx_rate(sequence, Px):
     plt.legend(loc='lower right')
     plt.savefig(os.path.join("graph", "pms_Pe_tranx_rate.png"))
     plt.show()
+
+def test_exact_against_bigfloat(Px, Pe, msg_len, sample_size=20, structure='dyadic', precision=None):
+    """ Compare the exact fraction backend with the bigfloat backend
+
+    The exact run uses structure, the dyadic store by default, the bigfloat
+    run the same tree, or a splay tree, at precision bits, 2*msg_len + 40 by
+    default. Both transmit the same messages with the same channel noise.
+    Print the number of runs whose decoded message or channel use differ
+    and the largest difference of the decoded values, return True if no run
+    differs.
+    """
+    msg = read_msg(msg_len)
+    precision = precision if precision is not None else 2*msg_len + 40
+    other = structure if structure != 'dyadic' else 'splay'
+    mismatch = 0
+    max_diff = 0
+    for i in range(sample_size):
+        s1, v1, u1 = PMS(Px, Pe, backend='fraction', structure=structure, rng=i).transmit(msg[i], max_channel_use=500)
+        s2, v2, u2 = PMS(Px, Pe, backend=get_backend('bigfloat', precision), structure=other, rng=i).transmit(msg[i], max_channel_use=500)
+        if s1 != s2 or u1 != u2:
+            mismatch += 1
+        max_diff = max(max_diff, abs(float(v1) - float(v2)))
+    print("Exact against bigfloat: {} of {} runs differ, max value difference {}".format(mismatch, sample_size, max_diff))
+    return mismatch == 0
+
+def test_bigfloat_long_messages(Px, Pe, length=80, sample_size=5, precision=None):
+    """ Transmit messages longer than float64 on bigfloat of higher precision
+
+    precision is 2*length + 40 bits by default. Messages come from a
+    MessageSource. Print the number of wrong and capped runs, return True if
+    every message is decoded correctly before the cap.
+    """
+    MCU = 500
+    precision = precision if precision is not None else 2*length + 40
+    wrong = capped = 0
+    for i, m in enumerate(messages(length, sample_size, source_seed=0)):
+        s, v, u = PMS(Px, Pe, backend=get_backend('bigfloat', precision), rng=i).transmit(m, max_channel_use=MCU, seq_len=length)
+        wrong += s != m
+        capped += u >= MCU
+    print("Bigfloat at {} bits, length {}: {} of {} wrong, {} capped".format(precision, length, wrong, sample_size, capped))
+    return wrong == 0 and capped == 0
+
+def test_log_long_messages(Px, Pe, lengths=(80, 120), sample_size=10, structure='splay'):
+    """ Transmit long messages on the log backend, up to the channel use cap
+
+    Messages come from a MessageSource. Print the number of wrong and capped
+    runs of each length, return True if no run reaches the cap. Wrong runs
+    are expected at a rate of about Pe.
+    """
+    MCU = 500
+    passed = True
+    for l in lengths:
+        wrong = capped = 0
+        for i, m in enumerate(messages(l, sample_size, source_seed=0)):
+            s, v, u = PMS(Px, Pe, backend='log', structure=structure, rng=i).transmit(m, max_channel_use=MCU, seq_len=l)
+            wrong += s != m
+            capped += u >= MCU
+        print("Log backend, length {}: {} of {} wrong, {} capped".format(l, wrong, sample_size, capped))
+        passed = passed and capped == 0
+    return passed
     
 if __name__ == "__main__":
+    configure('info')
     comment = 'Px=0.3'
     # test_pms_once(100, Px, Pe)
     # test_pms_len_against_channel_use(seq, Px)
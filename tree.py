@@ -1,64 +1,67 @@
 '''
 Tree data structure for maintaining probaility 
  - Splay tree
- - AVL tree (NA)
+ - AVL tree
 
- three functions:
+ functions:
  quantile(p) -> x
  pmf(x) -> p
  pdf(x) -> p (NA)
+ pmf_pair(x1, x2) -> p1, p2: both in one descent
+
+ and the two updates used by the schemes:
+ split(p) -> root, x, width: cut the interval at quantile p
+ rescale(xs, masses): set the mass between consecutive cuts xs
+
+ compact(length, threshold, keep) -> removed: merge sibling leaves inside
+ one message interval of 2^-length, or of mass below threshold
+
+ split takes an optional lap(phase) callback, called after the quantile
+ and after restructuring the tree, so an observer can time both phases.
+ size() and depth() give the number of nodes and the height.
 '''
 
+import bisect
 import numpy as np
 import bigfloat as bf
 import matplotlib.pyplot as plt
+from numeric import DEFAULT_BACKEND
+from errors import TreeError
 
 class Tree():
-    def __init__(self, start_value, length, prob):
-        self.start_value = bf.BigFloat(start_value)
-        self.length, self.p = bf.BigFloat(length), bf.BigFloat(prob)
+    def __init__(self, start_value, length, prob, num=None):
+        self.num = num if num is not None else DEFAULT_BACKEND # numeric backend
+        self.start_value = self.num.value(start_value)
+        self.length, self.p = self.num.value(length), self.num.mass(prob)
         self.parent, self.left, self.right = None, None, None 
 
-class SplayTree(Tree):
-    def __init__(self, start_value, length, prob):
-        super().__init__(start_value, length, prob)
+    def convert(self, num):
+        """ Re-express every node of the tree with numeric backend num """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.num = num
+            node.start_value = num.value(node.start_value)
+            node.length, node.p = num.value(node.length), num.mass(node.p)
+            if node.left is not None:
+                stack.extend((node.left, node.right))
 
     def insert(self, node):
         node.parent = self
         self.left = node
-        self.right = SplayTree(node.start_value + node.length, self.length - node.length, 1 - node.p)
+        self.right = type(self)(node.start_value + node.length, self.length - node.length, 1 - node.p, self.num)
         self.right.parent = self
 
-    def quantile(self, probability):
-        p = probability
-        if not self.left: # leaf  
-            new_node = SplayTree(self.start_value, self.length * p, p)
-            self.insert(new_node)
-            return self.right
-        else:
-            if self.left.p - p == 0:
-                return self.right
-            elif self.left.p < p: # the left child's PMF is not enough
-                return self.right.quantile( (p - self.left.p) / self.right.p)
-            else:
-                return self.left.quantile( p / self.left.p)
-    
-    def PMF(self, x):
-        if not self.left: # leaf
-            return self.p * (x-self.start_value) / self.length
-        else:
-            if self.right.start_value < x:
-                return self.p * (self.left.p + self.right.PMF(x))
-            else:
-                return self.p * self.left.PMF(x)
-
     def zig(self): # right rotation
         # update probability
         self.left.p *= self.p
         self.right.p *= self.p
         self.p = self.parent.p
         self.parent.p = 1 - self.left.p
-        self.right.p /= self.parent.p
+        if self.parent.p == 0: # complement lost to rounding, sum the masses
+            self.parent.p = self.parent.right.p + self.right.p
+        if self.parent.p != 0:
+            self.right.p /= self.parent.p
         self.parent.right.p = 1 - self.right.p
 
         # update value and length
@@ -82,8 +85,8 @@ class SplayTree(Tree):
         elif not grandparent:
             pass
         else:
-            print("Error! Grandparent and parent are not matched in zig!\n {}\n {}\n {}".format(grandparent.start_value, self.left.start_value, self.right.start_value))
-            exit()
+            raise TreeError("Grandparent and parent are not matched in zig", grandparent=grandparent.start_value,
+                left=self.left.start_value, right=self.right.start_value)
         return self
 
     def zag(self): # left rotation
@@ -92,7 +95,10 @@ class SplayTree(Tree):
         self.right.p *= self.p
         self.p = self.parent.p
         self.parent.p = 1 - self.right.p
-        self.left.p /= self.parent.p
+        if self.parent.p == 0: # complement lost to rounding, sum the masses
+            self.parent.p = self.parent.left.p + self.left.p
+        if self.parent.p != 0:
+            self.left.p /= self.parent.p
         self.parent.left.p = 1 - self.left.p
 
         # update value and length
@@ -115,34 +121,193 @@ class SplayTree(Tree):
         elif not grandparent:
             pass
         else:
-            print("Error! Grandparent and parent are not matched in zag!\n {}\n {}\n {}".format(grandparent.start_value, self.left.start_value, self.right.start_value))
-            exit()
+            raise TreeError("Grandparent and parent are not matched in zag", grandparent=grandparent.start_value,
+                left=self.left.start_value, right=self.right.start_value)
         return self
+
+    def quantile(self, probability):
+        node, p = self, probability
+        while node.left is not None:
+            if node.left.p == p:
+                return node.right
+            elif node.left.p < p: # the left child's PMF is not enough
+                p = (p - node.left.p) / node.right.p
+                node = node.right
+            else:
+                p = p / node.left.p
+                node = node.left
+        node.insert(type(self)(node.start_value, node.length * p, p, self.num))
+        return node.right
+
+    def PMF(self, x):
+        return self._PMF(x, 1, 0)
+
+    def _PMF(self, x, mass, total):
+        """ PMF walk from this node, given the mass/PMF accumulated above it """
+        node = self
+        while node.left is not None:
+            mass *= node.p
+            if node.right.start_value < x:
+                total += mass * node.left.p
+                node = node.right
+            elif node.right.start_value == x:
+                return total + mass * node.left.p
+            else:
+                node = node.left
+        return total + mass * node.p * (x - node.start_value) / node.length
+
+    def PMF_pair(self, x1, x2):
+        """ PMF at x1 <= x2, sharing the descent until the two paths part """
+        node, mass, total = self, 1, 0
+        while node.left is not None:
+            m = node.right.start_value
+            if m < x1:
+                mass *= node.p
+                total += mass * node.left.p
+                node = node.right
+            elif x2 < m:
+                mass *= node.p
+                node = node.left
+            else:
+                break
+        return node._PMF(x1, mass, total), node._PMF(x2, mass, total)
+
+    @classmethod
+    def unit(cls, num=None):
+        """ Uniform probability on [0, 1] split at 1/2 """
+        tree = cls(0, 1, 1, num)
+        tree.insert(cls(0, 0.5, 0.5, num))
+        return tree
+
+    def rescale(self, xs, masses):
+        """ Scale the probability between consecutive cuts xs to masses
+        
+        xs must be sorted start values of existing nodes, masses has one more 
+        element than xs and sums to 1. Only nodes straddling a cut are visited.
+        Return the cumulative probability at xs before rescaling.
+        """
+        cdf = list(self.PMF_pair(*xs)) if len(xs) == 2 else [self.PMF(x) for x in xs]
+        bounds = [0] + cdf + [1]
+        # cuts closer than the precision leave empty regions, no node uses them
+        factors = [m / (ub - lb) if ub > lb else 0 for m, lb, ub in zip(masses, bounds, bounds[1:])]
+
+        # nodes straddling a cut, parents first
+        straddle, ratio = [], {}
+        stack = [(self, self.start_value + self.length)]
+        while stack:
+            node, end = stack.pop()
+            r = bisect.bisect_right(xs, node.start_value)
+            if node.left is None or r == bisect.bisect_left(xs, end):
+                ratio[node] = factors[r] # node lies in a single region
+            else:
+                straddle.append(node)
+                stack.append((node.left, node.right.start_value))
+                stack.append((node.right, end))
+
+        # children first, update conditional probabilities
+        for node in reversed(straddle):
+            pl = node.left.p * ratio[node.left]
+            pr = node.right.p * ratio[node.right]
+            ratio[node] = pl + pr
+            node.left.p = pl / ratio[node]
+            node.right.p = 1 - node.left.p
+        return cdf
+
+    def internal_nodes(self):
+        """ Nodes with children, parents first """
+        nodes, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            if node.left is not None:
+                nodes.append(node)
+                stack.extend((node.left, node.right))
+        return nodes
+
+    def size(self):
+        """ Number of nodes """
+        return 2 * len(self.internal_nodes()) + 1
+
+    def depth(self):
+        """ Number of edges on the longest path from the root to a leaf """
+        depth, stack = 0, [(self, 0)]
+        while stack:
+            node, d = stack.pop()
+            if node.left is None:
+                depth = max(depth, d)
+            else:
+                stack.extend(((node.left, d + 1), (node.right, d + 1)))
+        return depth
+
+    def compact(self, length=None, threshold=0, keep=()):
+        """ Merge sibling leaves inside one message interval or of small mass
+
+        Two leaves are merged into their parent if the parent lies inside one
+        interval [k/2^length, (k+1)/2^length], where the mass of every
+        message stays the same, or if its mass is below threshold. Merging
+        repeats up the tree. Boundaries in keep are never removed. Return
+        the number of merged nodes.
+        """
+        scale = 2**length if length is not None else None
+        nodes = self.internal_nodes()
+        mass = {self: self.p}
+        for node in nodes:
+            mass[node.left] = mass[node] * node.left.p
+            mass[node.right] = mass[node] * node.right.p
+
+        removed = 0
+        for node in reversed(nodes): # children first
+            if node.left.left is not None or node.right.left is not None:
+                continue
+            if node.right.start_value in keep:
+                continue
+            inside = False
+            if scale is not None:
+                k = int(node.start_value * scale)
+                inside = (node.start_value + node.length) * scale <= k + 1
+            if inside or mass[node] < threshold:
+                node.left, node.right = None, None
+                removed += 1
+        return removed
+
+class SplayTree(Tree):
+    def __init__(self, start_value, length, prob, num=None):
+        super().__init__(start_value, length, prob, num)
+
+    def split(self, p, lap=None):
+        node = self.quantile(p)
+        if lap is not None:
+            lap('quantile')
+        width = min(node.length, node.parent.left.length)
+        root = node.parent.rotate()
+        if lap is not None:
+            lap('rotate')
+        return root, node.start_value, width
     
     def rotate(self, subtree=False):
-        if not self.parent:
-            return self
-        if not self.parent.parent:
-            if subtree: # root of subtree
-                return self
-            return self.zig() if self.parent.left is self else self.zag()
+        node = self
+        while node.parent:
+            parent, grandparent = node.parent, node.parent.parent
+            if not grandparent:
+                if subtree: # root of subtree
+                    return node
+                return node.zig() if parent.left is node else node.zag()
         
-        grandparent = self.parent.parent
-        # grandparent, parent and child are on the same side
-        # zig-zig
-        if grandparent.left is self.parent and self.parent.left is self:
-            return self.parent.zig().left.zig().rotate()
-        # zag-zag
-        elif grandparent.right is self.parent and self.parent.right is self:
-            return self.parent.zag().right.zag().rotate()
-        # grandparent, parent and child are on the diff sides
-        elif grandparent.left is self.parent and self.parent.right is self:
-            return self.zag().zig().rotate()
-        elif grandparent.right is self.parent and self.parent.left is self:
-            return self.zig().zag().rotate()
-        else:
-            print("Error! No correction pattern!")
-            exit()
+            # grandparent, parent and child are on the same side
+            # zig-zig
+            if grandparent.left is parent and parent.left is node:
+                node = parent.zig().left.zig()
+            # zag-zag
+            elif grandparent.right is parent and parent.right is node:
+                node = parent.zag().right.zag()
+            # grandparent, parent and child are on the diff sides
+            elif grandparent.left is parent and parent.right is node:
+                node = node.zag().zig()
+            elif grandparent.right is parent and parent.left is node:
+                node = node.zig().zag()
+            else:
+                raise TreeError("No correction pattern", node=node.start_value,
+                    parent=parent.start_value, grandparent=grandparent.start_value)
+        return node
 
     def print_node(self, text='NODE'):
         """ Print out info about node, its children and its parent """
@@ -181,16 +346,121 @@ class SplayTree(Tree):
         print("-"*80 + "\n")
 
     def print_intervals(self, intervals, parent_prob=1):
-        if self.left is None: # leaf
-            p = parent_prob * self.p
-            intervals['value'].append(self.start_value)
-            intervals['length'].append(self.length)
-            intervals['probability'].append(p)
-            print("[{}, {}]: {}".format(self.start_value, self.start_value+self.length, p))
-        else:
-            self.left.print_intervals(intervals, parent_prob * self.p)
-            self.right.print_intervals(intervals, parent_prob * self.p)
+        stack = [(self, parent_prob)]
+        while stack:
+            node, parent_prob = stack.pop()
+            if node.left is None: # leaf
+                p = parent_prob * node.p
+                intervals['value'].append(node.start_value)
+                intervals['length'].append(node.length)
+                intervals['probability'].append(p)
+                print("[{}, {}]: {}".format(node.start_value, node.start_value+node.length, p))
+            else:
+                stack.append((node.right, parent_prob * node.p))
+                stack.append((node.left, parent_prob * node.p))
+
+class AVLTree(Tree):
+    def __init__(self, start_value, length, prob, num=None):
+        super().__init__(start_value, length, prob, num)
+        self.height = 0 # leaf
+
+    def insert(self, node):
+        super().insert(node)
+        self.height = 1
+
+    def update_height(self):
+        self.height = 1 + max(self.left.height, self.right.height)
+
+    def balance(self):
+        return 0 if self.left is None else self.left.height - self.right.height
+
+    def rebalance(self):
+        """ Restore heights and balance from node up to the root, return root """
+        node = self
+        while True:
+            node.update_height()
+            b = node.balance()
+            if b > 1: # left heavy
+                if node.left.balance() < 0: # left-right case
+                    child = node.left.right.zag()
+                    child.left.update_height()
+                    child.update_height()
+                node = node.left.zig()
+                node.right.update_height()
+                node.update_height()
+            elif b < -1: # right heavy
+                if node.right.balance() > 0: # right-left case
+                    child = node.right.left.zig()
+                    child.right.update_height()
+                    child.update_height()
+                node = node.right.zag()
+                node.left.update_height()
+                node.update_height()
+            if node.parent is None:
+                return node
+            node = node.parent
+
+    def split(self, p, lap=None):
+        node = self.quantile(p)
+        if lap is not None:
+            lap('quantile')
+        width = min(node.length, node.parent.left.length)
+        root = node.parent.rebalance()
+        if lap is not None:
+            lap('rebalance')
+        return root, node.start_value, width
+
+    def rebuild(self):
+        """ Rebuild the subtree of node on the same leaves at minimal height
+
+        The node keeps its place, interval and probability, the nodes below
+        it are reused. Leaves are halved by count, so the subtree is balanced.
+        """
+        leaves, pool = [], []
+        stack = [(self, self.num.mass(1))]
+        while stack:
+            node, mass = stack.pop()
+            if node.left is None:
+                leaves.append((node.start_value, node.length, mass))
+            else:
+                pool.extend((node.left, node.right))
+                stack.append((node.right, mass * node.right.p))
+                stack.append((node.left, mass * node.left.p))
+
+        stack = [(self, 0, len(leaves))]
+        while stack:
+            node, lo, hi = stack.pop()
+            node.height = (hi - lo - 1).bit_length()
+            if hi - lo == 1:
+                node.left, node.right = None, None
+                continue
+            mid = (lo + hi) // 2
+            node.left, node.right = pool.pop(), pool.pop()
+            for child, a, b in ((node.left, lo, mid), (node.right, mid, hi)):
+                child.parent = node
+                child.start_value = leaves[a][0]
+                child.length = sum((l for _, l, _ in leaves[a:b]), self.num.value(0))
+                stack.append((child, a, b))
+            ml = sum((m for _, _, m in leaves[lo:mid]), self.num.mass(0))
+            total = ml + sum((m for _, _, m in leaves[mid:hi]), self.num.mass(0))
+            node.left.p = ml / total if total != 0 else ml
+            node.right.p = 1 - node.left.p
+
+    def compact(self, length=None, threshold=0, keep=()):
+        """ Merge as Tree.compact, then restore the AVL balance
 
-class AVLTree(Tree): # TODO
-    def __init__(self, start_value, length, prob):
-        super().__init__(start_value, length, prob) # TODO
\ No newline at end of file
+        A merge can shorten a subtree by several levels, beyond what the
+        single rotations of rebalance() repair. Children first, every subtree
+        left out of balance is rebuilt.
+        """
+        removed = super().compact(length, threshold, keep)
+        nodes = self.internal_nodes()
+        for node in nodes:
+            node.left.height = node.right.height = 0
+        for node in reversed(nodes):
+            node.update_height()
+            if abs(node.balance()) > 1:
+                node.rebuild()
+        if not nodes:
+            self.height = 0
+        return removed
@@ -1,42 +1,48 @@
 import os
 import numpy as np
-from scipy.special import comb
+from capacity import h, BSC_capacity, BSC_Hamming_capacity, hamming_err_prob, hamming_LOEP
 
-# entropy function
-def h(x): return x * np.log2(1/x) + (1-x) * np.log2(1/(1-x))
+# binary message corpus: a header of magic, message length and count, then
+# one row of np.packbits bytes per message
+MSG_MAGIC = b'PMSMSG01'
+MSG_HEADER = np.dtype([('magic', 'S8'), ('length', '<u4'), ('count', '<u4')])
 
-# capacity
-def BSC_capacity(alpha): return 1 - h(alpha)
+def msg_file(L, ext='bin'):
+    return os.path.join('message', 'msg_{}.{}'.format(L, ext))
 
-def BSC_Hamming_capacity(n, k, rho):
-    """
-    n:   hamming block length
-    k:   hamming message length
-    rho: error probability, P(u_k != v_k)
-    C = I(u_k, v_k) / n = (H(v_k) - H(v_k|u_k)) / n 
-    """
-    H_vk_given_uk = (1-rho) * np.log2(1/(1-rho)) + rho * np.log2((2**k-1) / rho)
-    return (k - H_vk_given_uk) / n
+def write_msg(L, bits):
+    """ Write messages given as a 0/1 array of shape (count, L) to the corpus"""
+    bits = np.asarray(bits, dtype=np.uint8)
+    header = np.array([(MSG_MAGIC, L, len(bits))], dtype=MSG_HEADER)
+    with open(msg_file(L), 'wb') as f:
+        f.write(header.tobytes())
+        f.write(np.packbits(bits, axis=1).tobytes())
 
-# hamming code error probability
-def hamming_err_prob(Px, msg_len, block_len):
-    d = 3
-    sum_p = 0
-    for i in range(d//2 + 1):
-        sum_p += comb(block_len, i, exact=True) * Px**i * (1-Px)**(block_len-i)
-    return 1 - sum_p
+def load_msg(L):
+    """ Memory-mapped view of the packed messages of length L, (count, bytes)"""
+    fn = msg_file(L)
+    header = np.fromfile(fn, dtype=MSG_HEADER, count=1)[0]
+    if header['magic'] != MSG_MAGIC or header['length'] != L:
+        raise ValueError("{} is not a message corpus of length {}".format(fn, L))
+    shape = (int(header['count']), (L + 7) // 8)
+    return np.memmap(fn, dtype=np.uint8, mode='r', offset=MSG_HEADER.itemsize, shape=shape)
 
-def hamming_LOEP(Px, block_len):
-    """ Error probability of leading order"""
+def msg_to_int(row, L):
+    """ Message of L bits from its packed row"""
+    return int.from_bytes(row.tobytes(), 'big') >> (8 * len(row) - L)
 
-    return 3 * comb(block_len, 2) * Px * Px / block_len
+def read_msg(L, packed=False):
+    """ Read message file and return message, as ints of L bits if packed"""
+    if not os.path.exists(msg_file(L)): # text corpus
+        with open(msg_file(L, 'txt'), 'r') as f:
+            msg_list = f.readlines()
+            msg_list = [s.strip() for s in msg_list]
+        if packed:
+            msg_list = [int(s, 2) for s in msg_list]
+        return msg_list
 
-def read_msg(L):
-    """ Read message file and return message"""
-    fn = 'msg_{}.txt'.format(L)
-    fn = os.path.join('message', fn)
-    with open(fn, 'r') as f:
-        msg_list = f.readlines()
-        msg_list = [s.strip() for s in msg_list]
-    
-    return msg_list
\ No newline at end of file
+    rows = load_msg(L)
+    if packed:
+        return [msg_to_int(row, L) for row in rows]
+    bits = np.unpackbits(rows, axis=1, count=L) + ord('0')
+    return [row.tobytes().decode('ascii') for row in bits]
\ No newline at end of file